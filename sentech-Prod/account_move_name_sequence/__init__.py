@@ -1,2 +1,2 @@
-from .post_install import create_journal_sequences
+from .post_install import create_journal_sequences, drop_move_name_index
 from . import models
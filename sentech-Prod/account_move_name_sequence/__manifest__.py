@@ -18,10 +18,12 @@
         "account",
     ],
     "data": [
+        "data/ir_cron.xml",
         "views/account_journal.xml",
         "views/account_move.xml",
         "security/ir.model.access.csv",
     ],
     "post_init_hook": "create_journal_sequences",
+    "uninstall_hook": "drop_move_name_index",
     "installable": True,
 }
@@ -5,9 +5,11 @@
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
 
 import logging
+import time
 
 from odoo import _, api, fields, models
 from odoo.exceptions import ValidationError
+from odoo.tools import SQL
 
 _logger = logging.getLogger(__name__)
 
@@ -33,6 +35,12 @@ class AccountJournal(models.Model):
     )
     # Redefine the default to True as <=v13.0
     refund_sequence = fields.Boolean(default=True)
+    sequence_late_numbering = fields.Boolean(
+        string="Late Numbering",
+        help="Posted entries get a temporary name and are numbered right after "
+        "the posting transaction is committed, in a short transaction of their "
+        "own, so that concurrent postings do not wait on the sequence lock.",
+    )
 
     @api.constrains("refund_sequence_id", "sequence_id")
     def _check_journal_sequence(self):
@@ -66,6 +74,18 @@ class AccountJournal(models.Model):
                     % (journal.refund_sequence_id.display_name, journal.display_name)
                 )
 
+    @api.constrains("sequence_late_numbering", "restrict_mode_hash_table")
+    def _check_sequence_late_numbering(self):
+        for journal in self:
+            if journal.sequence_late_numbering and journal.restrict_mode_hash_table:
+                raise ValidationError(
+                    _(
+                        "On journal '%s', late numbering cannot be used with "
+                        "the lock of posted entries with hash."
+                    )
+                    % journal.display_name
+                )
+
     @api.model
     def create(self, vals):
         if not vals.get("sequence_id"):
@@ -101,141 +121,295 @@ class AccountJournal(models.Model):
     def _prepare_sequence_current_moves(self, refund=False):
         """Get sequence dict values the journal based on current moves"""
         self.ensure_one()
-        move_domain = [
-            ("journal_id", "=", self.id),
-            ("name", "!=", "/"),
-        ]
-        if self.refund_sequence:
-            #  Based on original Odoo behavior
-            if refund:
-                move_domain.append(("move_type", "in", ("out_refund", "in_refund")))
+        return self._prepare_sequences_current_moves([(self, refund)]).get(
+            (self.id, refund), {}
+        )
+
+    @api.model
+    def _prepare_sequences_current_moves(self, journal_refunds):
+        """Get sequence dict values of several journals based on current moves,
+        with one scan of the move names for all of them
+
+        :param journal_refunds: list of (journal, refund) tuples
+        :return: dict {(journal id, refund): sequence values}, without the
+                 journals for which the default values should be used
+        """
+        start = time.time()
+        last_moves = self._get_sequence_last_moves(journal_refunds)
+        _logger.info(
+            "Last moves of %s journal sequences found in %.2fs",
+            len(journal_refunds),
+            time.time() - start,
+        )
+        start = time.time()
+        result = {}
+        scans = {}
+        for journal, refund in journal_refunds:
+            key = (journal.id, refund)
+            msg_err = (
+                "Journal %s could not get sequence %s values based on current moves. "
+                "Using default values." % (journal.id, refund and "refund" or "")
+            )
+            last_move = last_moves.get(key)
+            if not last_move:
+                _logger.warning("%s %s", msg_err, "No moves found")
+                continue
+            try:
+                with self.env.cr.savepoint():
+                    # get the current sequence values could be buggy to get
+                    # But even we can use the default values
+                    # or do manual changes instead of raising errors
+                    last_sequence = last_move._get_last_sequence()
+                    if not last_sequence:
+                        last_sequence = (
+                            last_move._get_last_sequence(relaxed=True)
+                            or last_move._get_starting_sequence()
+                        )
+                    __, seq_format_values = last_move._get_sequence_format_param(
+                        last_sequence
+                    )
+                    seq_vals, scan = self._prepare_sequence_format_scan(
+                        seq_format_values
+                    )
+            except Exception as e:
+                _logger.warning("%s %s", msg_err, e)
+                continue
+            if scan:
+                scans[key] = (seq_vals, scan)
             else:
-                move_domain.append(("move_type", "not in", ("out_refund", "in_refund")))
-        last_move = self.env["account.move"].search(
-            move_domain, limit=1, order="id DESC"
+                result[key] = seq_vals
+        _logger.info(
+            "Formats of %s journal sequences computed in %.2fs",
+            len(journal_refunds),
+            time.time() - start,
+        )
+        start = time.time()
+        max_numbers = self._scan_sequence_max_numbers(
+            {key: scan for key, (__, scan) in scans.items()}
+        )
+        _logger.info(
+            "Move names of %s journal sequences scanned in %.2fs",
+            len(scans),
+            time.time() - start,
+        )
+        for key, (seq_vals, __) in scans.items():
+            if key not in max_numbers:
+                # the scan failed
+                continue
+            for year, month, max_number in max_numbers[key]:
+                self._update_sequence_vals_number(seq_vals, year, month, max_number)
+            result[key] = seq_vals
+        return result
+
+    @api.model
+    def _get_sequence_last_moves(self, journal_refunds):
+        """Return the last named move of each (journal, refund), the refund
+        flag only filtering the moves of journals with refund sequence"""
+        if not journal_refunds:
+            return {}
+        values = SQL(", ").join(
+            SQL(
+                "(%s, %s, %s)",
+                journal.id,
+                refund,
+                bool(journal.refund_sequence),
+            )
+            for journal, refund in journal_refunds
         )
-        msg_err = (
-            "Journal %s could not get sequence %s values based on current moves. "
-            "Using default values." % (self.id, refund and "refund" or "")
+        self.env["account.move"].flush_model(["journal_id", "name", "move_type"])
+        self.env.cr.execute(
+            SQL(
+                """
+                SELECT p.journal_id, p.refund, last_move.id
+                  FROM (VALUES %s) AS p(journal_id, refund, filter_refund)
+            CROSS JOIN LATERAL (
+                       SELECT m.id
+                         FROM account_move m
+                        WHERE m.journal_id = p.journal_id
+                          AND m.name != '/'
+                          AND (NOT p.filter_refund
+                               OR (m.move_type IN ('out_refund', 'in_refund'))
+                                  = p.refund)
+                     ORDER BY m.id DESC
+                        LIMIT 1
+                       ) AS last_move
+                """,
+                values,
+            )
         )
-        if not last_move:
-            _logger.warning("%s %s", msg_err, "No moves found")
+        return {
+            (journal_id, refund): self.env["account.move"].browse(move_id)
+            for journal_id, refund, move_id in self.env.cr.fetchall()
+        }
+
+    @api.model
+    def _prepare_sequence_format_scan(self, seq_format_values):
+        """Return the sequence values for a format of move names and the
+        parameters to scan the names for the last numbers, or None if the
+        format has no year and the sequence values are complete"""
+        prefix1 = seq_format_values["prefix1"]
+        prefix = prefix1
+        if seq_format_values["year_length"] == 4:
+            prefix += "%(range_year)s"
+        elif seq_format_values["year_length"] == 2:
+            prefix += "%(range_y)s"
+        else:
+            # If there is not year so current values are valid
+            seq_vals = {
+                "padding": seq_format_values["seq_length"],
+                "suffix": seq_format_values["suffix"],
+                "prefix": prefix,
+                "date_range_ids": [],
+                "use_date_range": False,
+                "number_next_actual": seq_format_values["seq"] + 1,
+            }
+            return seq_vals, None
+        prefix2 = seq_format_values.get("prefix2") or ""
+        prefix += prefix2
+        month = seq_format_values.get("month")  # It is 0 if only have year
+        if month:
+            prefix += "%(range_month)s"
+        prefix3 = seq_format_values.get("prefix3") or ""
+        prefixes = prefix1 + prefix2
+        year_position = prefixes.count(prefix2) if prefix2 else 0
+        prefixes += prefix3
+        month_position = prefixes.count(prefix3) if prefix3 else 0
+        scan = {
+            "pattern": "%s%s%s%s%s%%"
+            % (
+                prefix1,
+                "_" * seq_format_values["year_length"],
+                prefix2,
+                "_" * bool(month) * 2,
+                prefix3,
+            ),
+            "prefix2": prefix2,
+            "year_position": year_position,
+            "prefix3": prefix3,
+            "month_position": month_position,
+            "number_separator": prefixes[-1],
+            "number_position": prefixes.count(prefixes[-1]) + 1,
+        }
+        prefix += prefix3
+        seq_vals = {
+            "padding": seq_format_values["seq_length"],
+            "suffix": seq_format_values["suffix"],
+            "prefix": prefix,
+            "date_range_ids": [],
+            "use_date_range": True,
+        }
+        return seq_vals, scan
+
+    @api.model
+    def _scan_sequence_max_numbers(self, scans):
+        """Return the max numbers of the move names per year and month, for
+        each (journal id, refund) key of ``scans``
+
+        All the names are scanned in one query; if it fails (e.g. a name not
+        ending by a number), each journal is scanned on its own, the failing
+        ones being left out to use the default values.
+        """
+        if not scans:
             return {}
+        self.env["account.move"].flush_model(["journal_id", "name"])
+        keys = list(scans)
+        self.env["account.move"]._explain_uses_name_index(
+            self._get_sequence_max_numbers_query(keys, scans)
+        )
         try:
             with self.env.cr.savepoint():
-                # get the current sequence values could be buggy to get
-                # But even we can use the default values
-                # or do manual changes instead of raising errors
-                last_sequence = last_move._get_last_sequence()
-                if not last_sequence:
-                    last_sequence = (
-                        last_move._get_last_sequence(relaxed=True)
-                        or last_move._get_starting_sequence()
-                    )
-
-                __, seq_format_values = last_move._get_sequence_format_param(
-                    last_sequence
-                )
-                prefix1 = seq_format_values["prefix1"]
-                prefix = prefix1
-                if seq_format_values["year_length"] == 4:
-                    prefix += "%(range_year)s"
-                elif seq_format_values["year_length"] == 2:
-                    prefix += "%(range_y)s"
-                else:
-                    # If there is not year so current values are valid
-                    seq_vals = {
-                        "padding": seq_format_values["seq_length"],
-                        "suffix": seq_format_values["suffix"],
-                        "prefix": prefix,
-                        "date_range_ids": [],
-                        "use_date_range": False,
-                        "number_next_actual": seq_format_values["seq"] + 1,
-                    }
-                    return seq_vals
-                prefix2 = seq_format_values.get("prefix2") or ""
-                prefix += prefix2
-                month = seq_format_values.get("month")  # It is 0 if only have year
-                if month:
-                    prefix += "%(range_month)s"
-                prefix3 = seq_format_values.get("prefix3") or ""
-                where_name_value = "%s%s%s%s%s%%" % (
-                    prefix1,
-                    "_" * seq_format_values["year_length"],
-                    prefix2,
-                    "_" * bool(month) * 2,
-                    prefix3,
-                )
-                prefixes = prefix1 + prefix2
-                select_year = (
-                    "split_part(name, '%s', %d)" % (prefix2, prefixes.count(prefix2))
-                    if prefix2
-                    else "''"
-                )
-                prefixes += prefix3
-                select_month = (
-                    "split_part(name, '%s', %d)" % (prefix3, prefixes.count(prefix3))
-                    if prefix3
-                    else "''"
-                )
-                select_max_number = (
-                    "MAX(split_part(name, '%s', %d)::INTEGER) AS max_number"
-                    % (prefixes[-1], prefixes.count(prefixes[-1]) + 1)
-                )
-                query = (
-                    "SELECT %s, %s, %s FROM account_move "
-                    "WHERE name LIKE %%s AND journal_id=%%s GROUP BY 1,2"
-                ) % (
-                    select_year,
-                    select_month,
-                    select_max_number,
+                return self._scan_sequence_max_numbers_query(keys, scans)
+        except Exception as e:
+            _logger.warning("Scan of the move names failed, retry by journal: %s", e)
+        result = {}
+        for key in keys:
+            try:
+                with self.env.cr.savepoint():
+                    result.update(self._scan_sequence_max_numbers_query([key], scans))
+            except Exception as e:
+                _logger.warning(
+                    "Journal %s could not get sequence values based on current "
+                    "moves. Using default values. %s",
+                    key[0],
+                    e,
                 )
-                # It is not using user input
-                # pylint: disable=sql-injection
-                self.env.cr.execute(query, (where_name_value, self.id))
-                res = self.env.cr.fetchall()
-                prefix += prefix3
-                seq_vals = {
-                    "padding": seq_format_values["seq_length"],
-                    "suffix": seq_format_values["suffix"],
-                    "prefix": prefix,
-                    "date_range_ids": [],
-                    "use_date_range": True,
+        return result
+
+    @api.model
+    def _scan_sequence_max_numbers_query(self, keys, scans):
+        self.env.cr.execute(self._get_sequence_max_numbers_query(keys, scans))
+        result = {key: [] for key in keys}
+        for key_index, year, month, max_number in self.env.cr.fetchall():
+            result[keys[key_index]].append((year, month, max_number))
+        return result
+
+    @api.model
+    def _get_sequence_max_numbers_query(self, keys, scans):
+        # one scan per journal with its pattern as a constant, the only way
+        # for the planner to use the "name text_pattern_ops" part of the index
+        return SQL(" UNION ALL ").join(
+            SQL(
+                """
+                (SELECT %s,
+                        %s,
+                        %s,
+                        MAX(split_part(m.name, %s, %s)::INTEGER)
+                   FROM account_move m
+                  WHERE m.journal_id = %s AND m.name LIKE %s
+               GROUP BY 2, 3)
+                """,
+                index,
+                self._get_sequence_name_part(scans[key], "prefix2", "year_position"),
+                self._get_sequence_name_part(scans[key], "prefix3", "month_position"),
+                scans[key]["number_separator"],
+                scans[key]["number_position"],
+                key[0],
+                scans[key]["pattern"],
+            )
+            for index, key in enumerate(keys)
+        )
+
+    @api.model
+    def _get_sequence_name_part(self, scan, separator, position):
+        if not scan[separator]:
+            return SQL("''::TEXT")
+        return SQL(
+            "split_part(m.name, %s, %s)", scan[separator], scan[position]
+        )
+
+    @api.model
+    def _update_sequence_vals_number(self, seq_vals, year, month, max_number):
+        """Set the next number of the sequence values, or of one of its date
+        ranges, from the max number of the moves of a year and month"""
+        if not year and not month:
+            seq_vals.update(
+                {
+                    "use_date_range": False,
+                    "number_next_actual": max_number + 1,
                 }
-                for year, month, max_number in res:
-                    if not year and not month:
-                        seq_vals.update(
-                            {
-                                "use_date_range": False,
-                                "number_next_actual": max_number + 1,
-                            }
-                        )
-                        continue
-                    if len(year) == 2:
-                        # Year >=50 will be considered as last century 1950
-                        # Year <=49 will be considered as current century 2049
-                        if int(year) >= 50:
-                            year = "19" + year
-                        else:
-                            year = "20" + year
-                    if month:
-                        date_from = fields.Date.to_date("%s-%s-1" % (year, month))
-                        date_to = fields.Date.end_of(date_from, "month")
-                    else:
-                        date_from = fields.Date.to_date("%s-1-1" % year)
-                        date_to = fields.Date.to_date("%s-12-31" % year)
-                    seq_vals["date_range_ids"].append(
-                        (
-                            0,
-                            0,
-                            {
-                                "date_from": date_from,
-                                "date_to": date_to,
-                                "number_next_actual": max_number + 1,
-                            },
-                        )
-                    )
-                return seq_vals
-        except Exception as e:
-            _logger.warning("%s %s", msg_err, e)
-        return {}
+            )
+            return
+        if len(year) == 2:
+            # Year >=50 will be considered as last century 1950
+            # Year <=49 will be considered as current century 2049
+            if int(year) >= 50:
+                year = "19" + year
+            else:
+                year = "20" + year
+        if month:
+            date_from = fields.Date.to_date("%s-%s-1" % (year, month))
+            date_to = fields.Date.end_of(date_from, "month")
+        else:
+            date_from = fields.Date.to_date("%s-1-1" % year)
+            date_to = fields.Date.to_date("%s-12-31" % year)
+        seq_vals["date_range_ids"].append(
+            (
+                0,
+                0,
+                {
+                    "date_from": date_from,
+                    "date_to": date_to,
+                    "number_next_actual": max_number + 1,
+                },
+            )
+        )
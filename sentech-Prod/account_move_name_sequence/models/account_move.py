@@ -2,7 +2,25 @@
 # @author: Alexis de Lattre <alexis.delattre@akretion.com>
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
 
+import json
+import logging
+import re
+from collections import defaultdict
+
 from odoo import api, fields, models
+from odoo.tools import SQL
+from odoo.tools.sql import create_index
+
+_logger = logging.getLogger(__name__)
+
+# index for the scans of move names by journal and prefix (name LIKE 'PREFIX%')
+NAME_INDEX = "account_move_journal_id_name_pattern_index"
+# condition on the name in the index scans of EXPLAIN, e.g.
+# ((name)::text ~>=~ 'INV/'::text)
+NAME_INDEX_COND = re.compile(r"\bname\)?(::text)? ~(>=|<)~")
+
+# prefix of the temporary name of the entries waiting for late numbering
+LATE_NAME_PREFIX = "*"
 
 
 class AccountMove(models.Model):
@@ -24,8 +42,58 @@ class AccountMove(models.Model):
         ),
     ]
 
+    def _auto_init(self):
+        res = super()._auto_init()
+        # created again on module update if it went missing, e.g. after a
+        # restore without indexes
+        create_index(
+            self.env.cr,
+            NAME_INDEX,
+            self._table,
+            ["journal_id", "name text_pattern_ops"],
+        )
+        return res
+
+    @api.model
+    def _explain_uses_name_index(self, query):
+        """Return whether, according to EXPLAIN, every scan of the moves in
+        ``query`` uses the name index with a condition on the name, and log it"""
+        self.env.cr.execute(SQL("EXPLAIN (FORMAT JSON) %s", query))
+        plan = self.env.cr.fetchone()[0]
+
+        def iter_nodes(node):
+            yield node
+            for child in node.get("Plans", []):
+                yield from iter_nodes(child)
+
+        def uses_name_index(node):
+            # the node itself for an index scan, a child for a bitmap scan
+            return any(
+                child.get("Index Name") == NAME_INDEX
+                and NAME_INDEX_COND.search(child.get("Index Cond", ""))
+                for child in iter_nodes(node)
+            )
+
+        scans = [
+            node
+            for node in iter_nodes(plan[0]["Plan"])
+            if node.get("Relation Name") == self._table
+        ]
+        used = bool(scans) and all(uses_name_index(node) for node in scans)
+        if used:
+            _logger.info("Move name scan uses the index %s", NAME_INDEX)
+        else:
+            _logger.warning(
+                "Move name scan does not use the index %s, plan: %s",
+                NAME_INDEX,
+                json.dumps(plan),
+            )
+        return used
+
     @api.depends("state", "journal_id", "date")
     def _compute_name_by_sequence(self):
+        # moves to number per sequence, numbered together
+        moves_by_seq = defaultdict(list)
         for move in self:
             name = move.name or "/"
             # I can't use posted_before in this IF because
@@ -37,20 +105,100 @@ class AccountMove(models.Model):
                 and move.journal_id
                 and move.journal_id.sequence_id
             ):
-                if (
-                    move.move_type in ("out_refund", "in_refund")
-                    and move.journal_id.type in ("sale", "purchase")
-                    and move.journal_id.refund_sequence
-                    and move.journal_id.refund_sequence_id
-                ):
-                    seq = move.journal_id.refund_sequence_id
-                else:
-                    seq = move.journal_id.sequence_id
-                # next_by_id(date) only applies on ir.sequence.date_range selection
-                # => we use with_context(ir_sequence_date=date).next_by_id()
-                # which applies on ir.sequence.date_range selection AND prefix
-                name = seq.with_context(ir_sequence_date=move.date).next_by_id()
+                if move.journal_id.sequence_late_numbering and move.id:
+                    # numbered by _assign_late_names() after commit
+                    move.name = "%s%s" % (LATE_NAME_PREFIX, move.id)
+                    continue
+                moves_by_seq[move._get_name_sequence()].append(move)
+                continue
             move.name = name
+        for seq, moves in moves_by_seq.items():
+            # next_by_dates() applies the move date on ir.sequence.date_range
+            # selection AND prefix, like
+            # with_context(ir_sequence_date=date).next_by_id()
+            names = seq.next_by_dates([move.date for move in moves])
+            for move, name in zip(moves, names):
+                move.name = name
+
+    def _get_name_sequence(self):
+        self.ensure_one()
+        if (
+            self.move_type in ("out_refund", "in_refund")
+            and self.journal_id.type in ("sale", "purchase")
+            and self.journal_id.refund_sequence
+            and self.journal_id.refund_sequence_id
+        ):
+            return self.journal_id.refund_sequence_id
+        return self.journal_id.sequence_id
+
+    def _is_late_name_pending(self):
+        self.ensure_one()
+        return self.state == "posted" and (self.name or "").startswith(
+            LATE_NAME_PREFIX
+        )
+
+    def _post(self, soft=True):
+        posted = super()._post(soft=soft)
+        pending = posted.filtered(lambda move: move._is_late_name_pending())
+        if pending:
+            pending._schedule_late_names()
+        return posted
+
+    def _schedule_late_names(self):
+        """Number the moves in a new transaction once the current one is
+        committed, the sequence lock being held only for that transaction"""
+        postcommit = self.env.cr.postcommit
+        move_ids = postcommit.data.setdefault(
+            "account_move_name_sequence.late_names", set()
+        )
+        if not move_ids:
+            registry = self.env.registry
+            context = dict(self.env.context)
+
+            @postcommit.add
+            def assign_late_names():
+                with registry.cursor() as cr:
+                    env = api.Environment(cr, self.env.uid, context)
+                    moves = env["account.move"].sudo().browse(sorted(move_ids))
+                    moves._assign_late_names()
+
+        move_ids.update(self.ids)
+
+    def _assign_late_names(self):
+        """Give their final name to posted moves waiting for late numbering"""
+        if not self:
+            return
+        # skip the moves numbered by another transaction in the meantime
+        self.flush_recordset(["name", "state"])
+        self.env.cr.execute(
+            SQL(
+                "SELECT id FROM account_move WHERE id IN %s AND state = 'posted' "
+                "AND name LIKE %s ORDER BY id FOR UPDATE SKIP LOCKED",
+                tuple(self.ids),
+                LATE_NAME_PREFIX + "%",
+            )
+        )
+        moves = self.browse([move_id for move_id, in self.env.cr.fetchall()])
+        moves.invalidate_recordset(["name", "state"])
+        moves_by_seq = defaultdict(list)
+        for move in moves:
+            moves_by_seq[move._get_name_sequence()].append(move)
+        for seq, seq_moves in moves_by_seq.items():
+            names = seq.next_by_dates([move.date for move in seq_moves])
+            for move, name in zip(seq_moves, names):
+                vals = {"name": name}
+                if move.payment_reference == move.name:
+                    vals["payment_reference"] = name
+                move.write(vals)
+        _logger.info("Late numbering: %s journal entries numbered", len(moves))
+
+    @api.model
+    def _cron_assign_late_names(self):
+        """Number the moves whose late numbering did not run after commit"""
+        self.search(
+            [("state", "=", "posted"), ("name", "=like", LATE_NAME_PREFIX + "%")],
+            order="id",
+        )._assign_late_names()
 
     # We must by-pass this constraint of sequence.mixin
     def _constrains_date_sequence(self):
@@ -1,9 +1,150 @@
-from odoo import fields, models
+from bisect import bisect_right
+from collections import defaultdict
+
+from odoo import _, api, fields, models, tools
+from odoo.exceptions import UserError
+from odoo.tools import SQL
+
+# key of the cursor cache holding the ids of the date ranges created by the
+# current transaction, the only ones a savepoint rollback can remove
+CREATED_DATE_RANGES = "account_move_name_sequence.created_date_ranges"
+
+
+def _update_nogap_block(record, count, number_increment):
+    """Reserve ``count`` numbers of a no gap sequence or date range with one
+    locked UPDATE, return them in increasing order"""
+    record.flush_recordset(["number_next"])
+    record.env.cr.execute(
+        SQL(
+            "UPDATE %s SET number_next = number_next + %s WHERE id = %s "
+            "RETURNING number_next",
+            SQL.identifier(record._table),
+            count * number_increment,
+            record.id,
+        )
+    )
+    row = record.env.cr.fetchone()
+    if not row:
+        raise UserError(
+            _(
+                "The record %(id)s of %(model)s to number from no longer "
+                "exists.",
+                id=record.id,
+                model=record._description,
+            )
+        )
+    number_stop = row[0]
+    record.invalidate_recordset(["number_next"])
+    number_start = number_stop - count * number_increment
+    return list(range(number_start, number_stop, number_increment))
+
+
+def _select_nextval_block(cr, seq_name, count):
+    cr.execute(
+        SQL("SELECT nextval(%s) FROM generate_series(1, %s)", seq_name, count)
+    )
+    return sorted(number for number, in cr.fetchall())
 
 
 class IrSequence(models.Model):
     _inherit = "ir.sequence"
 
+    def _next_block(self, count):
+        """Reserve ``count`` numbers at once, like ``count`` calls of _next_do()
+        but with one query"""
+        self.ensure_one()
+        if self.implementation == "standard":
+            return _select_nextval_block(
+                self.env.cr, "ir_sequence_%03d" % self.id, count
+            )
+        return _update_nogap_block(self, count, self.number_increment)
+
+    def _format_numbers(self, numbers, dates):
+        """Build the names of ``numbers``, the prefix and suffix of each name
+        being interpolated with the matching date of ``dates``"""
+        prefix_suffix = {}
+        names = []
+        for number, date in zip(numbers, dates):
+            if date not in prefix_suffix:
+                prefix_suffix[date] = self.with_context(
+                    ir_sequence_date=date
+                )._get_prefix_suffix()
+            prefix, suffix = prefix_suffix[date]
+            names.append(prefix + "%%0%sd" % self.padding % number + suffix)
+        return names
+
+    def next_by_dates(self, dates):
+        """Return one name per date of ``dates``, like calling
+        ``with_context(ir_sequence_date=date).next_by_id()`` for each date,
+        but with one locked query per date range"""
+        self.ensure_one()
+        self.check_access("read")
+        if not dates:
+            return []
+        if not self.use_date_range:
+            return self._format_numbers(self._next_block(len(dates)), dates)
+        date_ranges = {}
+        indexes_by_range = defaultdict(list)
+        for index, date in enumerate(dates):
+            dt = date or fields.Date.today()
+            if dt not in date_ranges:
+                date_ranges[dt] = self._get_date_range(
+                    dt
+                ) or self._create_date_range_seq(dt)
+            indexes_by_range[date_ranges[dt]].append(index)
+        names = [None] * len(dates)
+        for seq_date, indexes in indexes_by_range.items():
+            numbers = seq_date._next_block(len(indexes))
+            range_names = self.with_context(
+                ir_sequence_date_range=seq_date.date_from
+            )._format_numbers(numbers, [dates[index] for index in indexes])
+            for index, name in zip(indexes, range_names):
+                names[index] = name
+        return names
+
+    def _get_date_range(self, date):
+        """Return the date range of the sequence including ``date``, looked up
+        in the cached index of the date ranges, and searched on a miss"""
+        self.ensure_one()
+        date = fields.Date.to_date(date)
+        sequence_range = self.env["ir.sequence.date_range"]
+        index = sequence_range._get_date_range_index(self.id)
+        position = bisect_right(index["starts"], date) - 1
+        cached_range = sequence_range
+        # the closest range starting before the date, unless ranges overlap
+        while position >= 0:
+            if index["ends"][position] >= date:
+                cached_range = sequence_range.browse(index["ids"][position])
+                if not cached_range._may_be_rolled_back():
+                    return cached_range
+                break
+            position -= 1
+        date_range = sequence_range.search(
+            [
+                ("sequence_id", "=", self.id),
+                ("date_from", "<=", date),
+                ("date_to", ">=", date),
+            ],
+            limit=1,
+        )
+        if date_range != cached_range:
+            # stale index
+            self.env.registry.clear_cache()
+        return date_range
+
+    def _next(self, sequence_date=None):
+        # Same as the core method, with the date range taken from the cached
+        # index rather than searched
+        if not self.use_date_range:
+            return super()._next(sequence_date=sequence_date)
+        dt = sequence_date or self._context.get(
+            "ir_sequence_date", fields.Date.today()
+        )
+        seq_date = self._get_date_range(dt)
+        if not seq_date:
+            seq_date = self._create_date_range_seq(dt)
+        return seq_date.with_context(ir_sequence_date_range=seq_date.date_from)._next()
+
     def _create_date_range_seq(self, date):
         # Fix issue creating new date range for future dates
         # It assigns more than one month
@@ -21,28 +162,15 @@ class IrSequence(models.Model):
         else:
             date_from = fields.Date.start_of(date_obj, "year")
             date_to = fields.Date.end_of(date_obj, "year")
-        date_range = sequence_range.search(
-            [
-                ("sequence_id", "=", self.id),
-                ("date_from", ">=", date),
-                ("date_from", "<=", date_to),
-            ],
-            order="date_from desc",
-            limit=1,
-        )
-        if date_range:
-            date_to = fields.Date.subtract(date_range.date_from, days=1)
-        date_range = sequence_range.search(
-            [
-                ("sequence_id", "=", self.id),
-                ("date_to", ">=", date_from),
-                ("date_to", "<=", date),
-            ],
-            order="date_to desc",
-            limit=1,
-        )
-        if date_range:
-            date_to = fields.Date.add(date_range.date_to, days=1)
+        index = sequence_range._get_date_range_index(self.id)
+        # last range starting between the date and the end of the new range
+        position = bisect_right(index["starts"], date_to) - 1
+        if position >= 0 and index["starts"][position] >= date_obj:
+            date_to = fields.Date.subtract(index["starts"][position], days=1)
+        # last range ending between the start of the new range and the date
+        position = bisect_right(index["sorted_ends"], date_obj) - 1
+        if position >= 0 and index["sorted_ends"][position] >= date_from:
+            date_from = fields.Date.add(index["sorted_ends"][position], days=1)
         sequence_range_vals = {
             "date_from": date_from,
             "date_to": date_to,
@@ -50,3 +178,67 @@ class IrSequence(models.Model):
         }
         seq_date_range = sequence_range.sudo().create(sequence_range_vals)
         return seq_date_range
+
+
+class IrSequenceDateRange(models.Model):
+    _inherit = "ir.sequence.date_range"
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        date_ranges = super().create(vals_list)
+        created = self.env.cr.cache.setdefault(CREATED_DATE_RANGES, set())
+        created.update(date_ranges.ids)
+        self.env.cr.postcommit.add(created.clear)
+        self.env.registry.clear_cache()
+        return date_ranges
+
+    def write(self, vals):
+        res = super().write(vals)
+        if {"date_from", "date_to", "sequence_id"} & set(vals):
+            self.env.registry.clear_cache()
+        return res
+
+    def unlink(self):
+        res = super().unlink()
+        self.env.registry.clear_cache()
+        return res
+
+    def _may_be_rolled_back(self):
+        """Return whether the range was created by the current transaction and
+        its values were dropped from the cache since, as done by the rollback
+        of a savepoint"""
+        self.ensure_one()
+        return self.id in self.env.cr.cache.get(
+            CREATED_DATE_RANGES, ()
+        ) and not self.env.cache.contains(self, self._fields["date_from"])
+
+    @api.model
+    @tools.ormcache("sequence_id")
+    def _get_date_range_index(self, sequence_id):
+        """Return the date ranges of a sequence sorted by start date, as
+        ``starts``, ``ends`` and ``ids`` tuples, with ``sorted_ends`` the end
+        dates sorted, for bisect lookups"""
+        date_ranges = (
+            self.sudo()
+            .search([("sequence_id", "=", sequence_id)], order="date_from, id")
+            .read(["date_from", "date_to"], load=False)
+        )
+        ends = tuple(date_range["date_to"] for date_range in date_ranges)
+        return {
+            "starts": tuple(date_range["date_from"] for date_range in date_ranges),
+            "ends": ends,
+            "ids": tuple(date_range["id"] for date_range in date_ranges),
+            "sorted_ends": tuple(sorted(ends)),
+        }
+
+    def _next_block(self, count):
+        """Reserve ``count`` numbers at once, like ``count`` calls of _next()
+        but with one query"""
+        self.ensure_one()
+        if self.sequence_id.implementation == "standard":
+            return _select_nextval_block(
+                self.env.cr,
+                "ir_sequence_%03d_%03d" % (self.sequence_id.id, self.id),
+                count,
+            )
+        return _update_nogap_block(self, count, self.sequence_id.number_increment)
@@ -4,27 +4,64 @@
 # @author: Moisés López <moylop260@vauxoo.com>
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl).
 
-from odoo import SUPERUSER_ID, api
+import logging
+import time
+
+from odoo.tools import SQL
+
+from .models.account_move import NAME_INDEX
+
+_logger = logging.getLogger(__name__)
 
 
 def create_journal_sequences(env):
+    start = time.time()
     journals = (
         env["account.journal"]
         .with_context(active_test=False)
         .search([("sequence_id", "=", False)])
     )
-    for journal in journals:
+    journal_refunds = [(journal, False) for journal in journals] + [
+        (journal, True)
+        for journal in journals
+        if journal.type in ("sale", "purchase") and journal.refund_sequence
+    ]
+    # one scan of the current moves for all the journals
+    current_moves_vals = env["account.journal"]._prepare_sequences_current_moves(
+        journal_refunds
+    )
+    _logger.info(
+        "Sequence values of %s journals computed in %.2fs",
+        len(journals),
+        time.time() - start,
+    )
+    start = time.time()
+    seq_vals_list = []
+    for journal, refund in journal_refunds:
         journal_vals = {
             "code": journal.code,
             "name": journal.name,
             "company_id": journal.company_id.id,
         }
-        seq_vals = journal._prepare_sequence(journal_vals)
-        seq_vals.update(journal._prepare_sequence_current_moves())
-        vals = {"sequence_id": env["ir.sequence"].create(seq_vals).id}
-        if journal.type in ("sale", "purchase") and journal.refund_sequence:
-            rseq_vals = journal._prepare_sequence(journal_vals, refund=True)
-            rseq_vals.update(journal._prepare_sequence_current_moves(refund=True))
-            vals["refund_sequence_id"] = env["ir.sequence"].create(rseq_vals).id
+        seq_vals = journal._prepare_sequence(journal_vals, refund=refund)
+        seq_vals.update(current_moves_vals.get((journal.id, refund), {}))
+        seq_vals_list.append(seq_vals)
+    sequences = env["ir.sequence"].create(seq_vals_list)
+    _logger.info(
+        "%s journal sequences created in %.2fs", len(sequences), time.time() - start
+    )
+    start = time.time()
+    vals_by_journal = {journal: {} for journal in journals}
+    for (journal, refund), sequence in zip(journal_refunds, sequences):
+        field_name = refund and "refund_sequence_id" or "sequence_id"
+        vals_by_journal[journal][field_name] = sequence.id
+    for journal, vals in vals_by_journal.items():
         journal.write(vals)
+    _logger.info(
+        "Sequences set on %s journals in %.2fs", len(journals), time.time() - start
+    )
     return
+
+
+def drop_move_name_index(env):
+    env.cr.execute(SQL("DROP INDEX IF EXISTS %s", SQL.identifier(NAME_INDEX)))
@@ -7,9 +7,15 @@ from datetime import datetime
 from freezegun import freeze_time
 
 from odoo import fields
+from odoo.exceptions import UserError
 from odoo.tests import tagged
 from odoo.tests.common import TransactionCase
 
+from odoo.addons.account_move_name_sequence.models.account_move import NAME_INDEX
+from odoo.addons.account_move_name_sequence.models.ir_sequence import (
+    _update_nogap_block,
+)
+
 
 @tagged("post_install", "-at_install")
 class TestAccountMoveNameSequence(TransactionCase):
@@ -135,6 +141,184 @@ class TestAccountMoveNameSequence(TransactionCase):
             move.action_post()
         self.assertEqual(move.name, "TEST-2022-07-0001")
 
+    def _create_misc_move(self, date):
+        return self.env["account.move"].create(
+            {
+                "date": date,
+                "journal_id": self.misc_journal.id,
+                "line_ids": [
+                    (0, 0, {"account_id": self.account1.id, "debit": 10}),
+                    (0, 0, {"account_id": self.account2.id, "credit": 10}),
+                ],
+            }
+        )
+
+    def test_batch_move_name(self):
+        seq = self.misc_journal.sequence_id
+        seq.prefix = "BATCH-%(range_year)s-"
+        moves = self.env["account.move"]
+        for date in ("2021-03-01", "2022-01-15", "2021-05-01", "2022-02-01"):
+            moves |= self._create_misc_move(date)
+        moves.action_post()
+        self.assertEqual(
+            sorted(moves.mapped("name")),
+            [
+                "BATCH-2021-0001",
+                "BATCH-2021-0002",
+                "BATCH-2022-0001",
+                "BATCH-2022-0002",
+            ],
+        )
+        for move in moves:
+            self.assertTrue(move.name.startswith("BATCH-%s-" % move.date.year))
+        date_ranges = seq.date_range_ids.sorted("date_from")
+        self.assertEqual(date_ranges.mapped("number_next_actual"), [3, 3])
+        move = self._create_misc_move("2021-06-01")
+        move.action_post()
+        self.assertEqual(move.name, "BATCH-2021-0003")
+
+    def test_next_by_dates_without_date_range(self):
+        seq = self.env["ir.sequence"].create(
+            {
+                "name": "Test next_by_dates",
+                "implementation": "no_gap",
+                "prefix": "NBD/%(year)s/",
+                "padding": 3,
+                "number_increment": 2,
+                "company_id": self.company.id,
+            }
+        )
+        names = seq.next_by_dates(
+            [fields.Date.to_date("2021-01-01"), fields.Date.to_date("2022-01-01")]
+        )
+        self.assertEqual(names, ["NBD/2021/001", "NBD/2022/003"])
+        self.assertEqual(seq.next_by_id(), "NBD/%s/005" % datetime.now().year)
+
+    def test_late_numbering(self):
+        self.misc_journal.sequence_late_numbering = True
+        seq = self.misc_journal.sequence_id
+        seq.prefix = "LATE-%(range_year)s-"
+        moves = self._create_misc_move("2021-03-01") | self._create_misc_move(
+            "2021-03-02"
+        )
+        moves.action_post()
+        for move in moves:
+            self.assertEqual(move.name, "*%s" % move.id)
+        self.assertFalse(seq.date_range_ids)
+        # run by a post-commit hook or the cron
+        self.env["account.move"]._cron_assign_late_names()
+        self.assertEqual(moves.mapped("name"), ["LATE-2021-0001", "LATE-2021-0002"])
+        moves[0].button_draft()
+        moves[0].action_post()
+        self.assertEqual(moves[0].name, "LATE-2021-0001")
+
+    def test_date_range_index(self):
+        seq = self.misc_journal.sequence_id
+        date_ranges = self.env["ir.sequence.date_range"].create(
+            [
+                {
+                    "date_from": "2021-01-01",
+                    "date_to": "2021-12-31",
+                    "sequence_id": seq.id,
+                },
+                {
+                    "date_from": "2022-01-01",
+                    "date_to": "2022-06-30",
+                    "sequence_id": seq.id,
+                },
+            ]
+        )
+        seq._get_date_range("2021-01-01")
+        with self.assertQueryCount(0):
+            self.assertEqual(seq._get_date_range("2021-01-01"), date_ranges[0])
+            self.assertEqual(seq._get_date_range("2021-12-31"), date_ranges[0])
+            self.assertEqual(seq._get_date_range("2022-03-15"), date_ranges[1])
+        # searched without a cached range
+        self.assertFalse(seq._get_date_range("2020-12-31"))
+        self.assertFalse(seq._get_date_range("2022-07-01"))
+        # the new range starts after the last one
+        new_range = seq._create_date_range_seq("2022-07-01")
+        self.assertEqual(new_range.date_from, fields.Date.to_date("2022-07-01"))
+        self.assertEqual(new_range.date_to, fields.Date.to_date("2022-12-31"))
+        self.assertEqual(seq._get_date_range("2022-09-01"), new_range)
+        date_ranges[1].date_to = "2022-05-31"
+        self.assertFalse(seq._get_date_range("2022-06-15"))
+
+    def test_date_range_index_rollback(self):
+        seq = self.misc_journal.sequence_id
+        seq.date_range_ids.unlink()
+        with self.assertRaises(RuntimeError), self.env.cr.savepoint():
+            rolled_back = seq._create_date_range_seq("2023-03-01")
+            # the index is cached with the range, then the range rolled back
+            self.assertEqual(seq._get_date_range("2023-03-01"), rolled_back)
+            raise RuntimeError
+        self.assertFalse(seq._get_date_range("2023-03-01"))
+        date_range = seq._create_date_range_seq("2023-03-01")
+        self.assertNotEqual(date_range, rolled_back)
+        self.assertEqual(date_range.date_from, fields.Date.to_date("2023-01-01"))
+        self.assertEqual(seq._get_date_range("2023-03-01"), date_range)
+        date_range.unlink()
+        with self.assertRaises(UserError):
+            _update_nogap_block(date_range, 2, 1)
+
+    def test_prepare_sequences_current_moves(self):
+        for name, date in (
+            ("ADLM/2021/0005", "2021-03-01"),
+            ("ADLM/2021/0007", "2021-04-01"),
+            ("ADLM/2022/0002", "2022-01-01"),
+        ):
+            move = self._create_misc_move(date)
+            move.name = name
+            move.action_post()
+        key = (self.misc_journal.id, False)
+        seq_vals = self.env["account.journal"]._prepare_sequences_current_moves(
+            [(self.misc_journal, False)]
+        )[key]
+        self.assertEqual(seq_vals["prefix"], "ADLM/%(range_year)s/")
+        self.assertTrue(seq_vals["use_date_range"])
+        date_ranges = sorted(
+            (vals["date_from"], vals["number_next_actual"])
+            for __, __, vals in seq_vals["date_range_ids"]
+        )
+        self.assertEqual(
+            date_ranges,
+            [
+                (fields.Date.to_date("2021-01-01"), 8),
+                (fields.Date.to_date("2022-01-01"), 3),
+            ],
+        )
+        self.assertEqual(
+            self.misc_journal._prepare_sequence_current_moves(), seq_vals
+        )
+
+    def test_name_index(self):
+        self.env.cr.execute(
+            "SELECT indexdef FROM pg_indexes WHERE indexname = %s", [NAME_INDEX]
+        )
+        self.assertIn("text_pattern_ops", self.env.cr.fetchone()[0])
+        # on a test database the table is too small for the planner to prefer
+        # the index on its own
+        self.env.cr.execute("SET LOCAL enable_seqscan = off")
+        self.addCleanup(self.env.cr.execute, "SET LOCAL enable_seqscan = on")
+        journal_model = self.env["account.journal"]
+        scans = {}
+        for journal, last_name in (
+            (self.misc_journal, "ADLM/2021/0005"),
+            (self.purchase_journal, "BILL/2021/03/0007"),
+        ):
+            __, seq_format_values = self.env[
+                "account.move"
+            ]._get_sequence_format_param(last_name)
+            scans[(journal.id, False)] = journal_model._prepare_sequence_format_scan(
+                seq_format_values
+            )[1]
+        query = journal_model._get_sequence_max_numbers_query(list(scans), scans)
+        self.assertTrue(self.env["account.move"]._explain_uses_name_index(query))
+        # a scan without a constant prefix can not use the name part of the index
+        scans[(self.misc_journal.id, False)]["pattern"] = "%/2021/%"
+        query = journal_model._get_sequence_max_numbers_query(list(scans), scans)
+        self.assertFalse(self.env["account.move"]._explain_uses_name_index(query))
+
     def test_in_refund(self):
         in_refund_invoice = self.env["account.move"].create(
             {
@@ -41,9 +41,11 @@ importe la transección de contabilidad de XLS, importe la entrada de diario de
     """,
     'author': 'BrowseInfo',
     'website': 'https://www.browseinfo.in',
-    'depends': ['base','sale_management','account'],
+    'depends': ['base','sale_management','account','base_import'],
     'data': [
             'security/ir.model.access.csv',
+            'data/ir_cron.xml',
+            'views/import_job_views.xml',
             'wizard/account_move.xml'
         ],
     'qweb': [
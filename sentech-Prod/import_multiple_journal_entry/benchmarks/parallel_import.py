@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+# Part of BrowseInfo. See LICENSE file for full copyright and licensing details.
+
+"""Compare the duration of journal entry imports split in 1, 2, 4 and 8 jobs.
+
+The partition jobs are processed by the cron workers of a running server,
+this script only enqueues the imports and waits for them. The jobs commit, so
+use a scratch database, served with at least as many cron workers as
+partitions, and run the script from a shell without cron workers::
+
+    $ odoo-bin -d scratch_db --workers=2 --max-cron-threads=8 &
+    $ odoo-bin shell -d scratch_db --no-http --max-cron-threads=0
+    >>> from odoo.addons.import_multiple_journal_entry.benchmarks import parallel_import
+    >>> parallel_import.run(env, rows=200000)
+
+Each run imports the same generated file split in 1, 2, 4 and 8 jobs, prints
+the wall time (split included), throughput and speedup over one job, and
+removes the created entries afterwards.
+"""
+
+import time
+
+from odoo.addons.import_multiple_journal_entry.tests import data_generator
+
+
+def _wait(job, poll_interval, timeout):
+    started = time.time()
+    while time.time() - started < timeout:
+        # each poll reads the job in a new transaction
+        job.env.cr.rollback()
+        job.env.invalidate_all()
+        if job.state in ('done', 'failed'):
+            return
+        time.sleep(poll_interval)
+    raise TimeoutError('Journal entry import job %s not finished after %ss' % (job.id, timeout))
+
+
+def run(env, rows=200000, workers=(1, 2, 4, 8), lines_per_move=4, poll_interval=1, timeout=24 * 3600):
+    # the master data of a previous run on the same database is reused
+    master_data = data_generator.find_master_data(env, count=20) or data_generator.create_master_data(env, count=20)
+    payload = data_generator.to_csv(
+        data_generator.generate_rows(master_data, lines=rows, refs=rows // lines_per_move))
+    env['ir.config_parameter'].sudo().set_param('import_multiple_journal_entry.max_parallel_jobs', max(workers))
+    env.cr.commit()
+    Job = env['gen.journal.entry.job']
+    results = []
+    for worker_count in workers:
+        wizard = env['gen.journal.entry'].create({
+            'file_to_upload': payload,
+            'import_option': 'csv',
+            'worker_count': worker_count,
+            'run_in_background': True,
+        })
+        job = Job.browse(wizard.import_move_lines()['res_id'])
+        env.cr.commit()
+        started = time.time()
+        _wait(job, poll_interval, timeout)
+        elapsed = time.time() - started
+        jobs = job | job.child_ids
+        failed = jobs.filtered(lambda job: job.state != 'done')
+        results.append((worker_count, elapsed, rows / elapsed, job.moves_created, len(failed)))
+        env['account.move'].search([('ref', '=like', 'BENCH/%')]).unlink()
+        env['ir.attachment'].search([('res_model', '=', Job._name), ('res_id', 'in', jobs.ids)]).unlink()
+        job.unlink()
+        env.cr.commit()
+    print('%8s %12s %12s %8s %10s %8s' % ('workers', 'seconds', 'rows/s', 'speedup', 'moves', 'failed'))
+    for worker_count, elapsed, throughput, moves, failed in results:
+        print('%8d %12.1f %12.0f %8.2f %10d %8d' % (
+            worker_count, elapsed, throughput, results[0][1] / elapsed, moves, failed))
+    return results
@@ -0,0 +1,309 @@
+# -*- coding: utf-8 -*-
+# Part of BrowseInfo. See LICENSE file for full copyright and licensing details.
+
+import csv
+import itertools
+import logging
+import tempfile
+import time
+
+from odoo import models, fields, api, _
+
+from ..wizard.import_reader import IMPORT_KEYS
+
+_logger = logging.getLogger(__name__)
+
+# first key of the advisory locks taken on jobs, the second being the job id
+JOB_LOCK_NAMESPACE = 74921
+
+
+class GenJournalEntryJob(models.Model):
+    _name = "gen.journal.entry.job"
+    _description = "Journal Entry Import Job"
+    _order = "id desc"
+
+    name = fields.Char(string="Name", required=True, readonly=True,
+                       default=lambda self: _('Journal Entry Import %s') % fields.Datetime.now())
+    state = fields.Selection([
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ], string="Status", default='queued', required=True, readonly=True, index=True)
+    user_id = fields.Many2one('res.users', string="Requested by", default=lambda self: self.env.user, readonly=True)
+    company_id = fields.Many2one('res.company', string="Company", required=True, readonly=True,
+                                 default=lambda self: self.env.company)
+    attachment_id = fields.Many2one('ir.attachment', string="File", readonly=True, ondelete='set null')
+    import_option = fields.Selection([('csv', 'CSV File'), ('xls', 'XLS File'), ('xlsx', 'XLSX File'),
+                                      ('ods', 'ODS File')], string="Select",
+                                     default='csv', readonly=True)
+    chunk_size = fields.Integer(string="Batch Size", default=500, readonly=True)
+    parent_id = fields.Many2one('gen.journal.entry.job', string="Split From", readonly=True, index=True,
+                                ondelete='cascade')
+    child_ids = fields.One2many('gen.journal.entry.job', 'parent_id', string="Partitions")
+    is_split = fields.Boolean(string="Split", readonly=True,
+                              help="The file has been split into the partition jobs, which do the import.")
+    partition_index = fields.Integer(string="Partition", default=0, readonly=True)
+    partition_count = fields.Integer(string="Partitions", default=1, readonly=True,
+                                     help="The file is read once and its ref groups are split into this many jobs, "
+                                          "each with its own file, processed in parallel by the cron workers.")
+    groups_done = fields.Integer(string="Entries Processed", readonly=True,
+                                 help="Number of ref groups already imported, used to resume the job.")
+    moves_created = fields.Integer(string="Entries Created", readonly=True)
+    rows_total = fields.Integer(string="Total Rows", readonly=True)
+    rows_processed = fields.Integer(string="Rows Processed", readonly=True)
+    duration = fields.Float(string="Duration (s)", readonly=True, digits=(16, 2))
+    rows_per_second = fields.Float(string="Rows per Second", readonly=True, digits=(16, 1))
+    progress = fields.Float(string="Progress", compute='_compute_progress')
+    date_start = fields.Datetime(string="Started on", readonly=True)
+    date_end = fields.Datetime(string="Finished on", readonly=True)
+    error_log = fields.Text(string="Errors", readonly=True)
+
+    @api.depends('rows_processed', 'rows_total', 'child_ids.rows_processed')
+    def _compute_progress(self):
+        for job in self:
+            rows_processed = job.is_split and sum(job.child_ids.mapped('rows_processed')) or job.rows_processed
+            job.progress = job.rows_total and 100.0 * rows_processed / job.rows_total or 0.0
+
+    def _prepare_wizard_vals(self):
+        self.ensure_one()
+        return {
+            'file_to_upload': self.attachment_id.datas,
+            'import_option': self.import_option,
+            'company_id': self.company_id.id,
+            'chunk_size': self.chunk_size,
+        }
+
+    def _get_wizard(self):
+        """Return an in-memory import wizard on the job file.
+
+        ``new()`` is used so that the file is not copied into another
+        attachment every time the job is resumed.
+        """
+        return self.env['gen.journal.entry'].with_user(self.user_id).with_company(self.company_id).new(
+            self._prepare_wizard_vals())
+
+    def _try_lock(self):
+        # session level lock: it survives the commits done between batches
+        self.env.cr.execute('SELECT pg_try_advisory_lock(%s, %s)', (JOB_LOCK_NAMESPACE, self.id))
+        return self.env.cr.fetchone()[0]
+
+    def _unlock(self):
+        self.env.cr.execute('SELECT pg_advisory_unlock(%s, %s)', (JOB_LOCK_NAMESPACE, self.id))
+
+    def _process(self, time_limit):
+        """Import the remaining batches of the job, committing after each one.
+
+        :param time_limit: seconds after which the job stops after the current
+            batch; it is resumed from ``groups_done`` by the next cron run
+        :return: True when the job is finished (done or failed)
+        """
+        self.ensure_one()
+        if not self._try_lock():
+            # already being processed by another worker
+            return True
+        try:
+            # read the job again in a transaction started once locked, another
+            # worker may have finished it in the meantime
+            self.env.cr.commit()
+            self.invalidate_recordset()
+            if self.state not in ('queued', 'running'):
+                return True
+            if self.partition_count > 1 and not self.parent_id and not self.is_split:
+                return self._split()
+            return self._process_batches(time_limit)
+        finally:
+            self._unlock()
+
+    def _start(self):
+        if self.state == 'queued':
+            self.write({'state': 'running', 'date_start': fields.Datetime.now()})
+            self.env.cr.commit()
+
+    def _fail(self, error):
+        self.env.cr.rollback()
+        _logger.exception('Journal entry import job %s failed', self.id)
+        self.write({
+            'state': 'failed',
+            'date_end': fields.Datetime.now(),
+            'error_log': str(error),
+        })
+        self.env.cr.commit()
+
+    def _split(self):
+        """Read the file once and write the ref groups of each partition to the
+        file of a new job.
+
+        Groups are dealt in ref order to the partition with the fewest rows so
+        far, so the split only depends on the file. The partition jobs are then
+        picked up by the cron workers, each importing its own file only.
+        """
+        self._start()
+        files = []
+        try:
+            wizard = self._get_wizard()
+            keys = wizard._new_import_keys()
+            groups = wizard._group_import_rows(keys)
+            # unknown references fail the whole file before it is split
+            wizard._resolve_import_keys(keys)
+            files = [tempfile.TemporaryFile(mode='w+', encoding='utf-8', newline='')
+                     for index in range(self.partition_count)]
+            writers = [csv.writer(file) for file in files]
+            for writer in writers:
+                writer.writerow(IMPORT_KEYS)
+            rows = [0] * self.partition_count
+            for ref, group in groups:
+                index = rows.index(min(rows))
+                writers[index].writerows([row.get(key, '') for key in IMPORT_KEYS] for row in group)
+                rows[index] += len(group)
+            for index, file in enumerate(files):
+                if not rows[index]:
+                    continue
+                file.seek(0)
+                name = '%s (%s/%s)' % (self.name, index + 1, self.partition_count)
+                child = self.create({
+                    'name': name,
+                    'parent_id': self.id,
+                    'user_id': self.user_id.id,
+                    'company_id': self.company_id.id,
+                    'import_option': 'csv',
+                    'chunk_size': self.chunk_size,
+                    'partition_index': index,
+                    'partition_count': self.partition_count,
+                    'rows_total': rows[index],
+                })
+                child.attachment_id = self.env['ir.attachment'].create({
+                    'name': '%s.csv' % name,
+                    'raw': file.read().encode('utf-8'),
+                    'res_model': self._name,
+                    'res_id': child.id,
+                })
+                self.env.invalidate_all()
+            self.write({'is_split': True, 'rows_total': keys['rows']})
+            self.env.cr.commit()
+        except Exception as e:
+            self._fail(e)
+            return True
+        finally:
+            for file in files:
+                file.close()
+        _logger.info('Journal entry import job %s split into %s jobs', self.id, len(self.child_ids))
+        self._trigger_workers(len(self.child_ids))
+        return True
+
+    def _process_batches(self, time_limit):
+        started = last = time.time()
+        self._start()
+        try:
+            wizard = self._get_wizard()
+            keys = wizard._new_import_keys()
+            groups = wizard._group_import_rows(keys)
+            lookups = wizard._resolve_import_keys(keys)
+            self.rows_total = keys['rows']
+            groups = itertools.islice(groups, self.groups_done, None)
+            for vals_list, group_count, row_count in wizard._iter_import_chunks(groups, lookups):
+                moves = wizard._create_import_moves(vals_list)
+                now = time.time()
+                duration = self.duration + now - last
+                last = now
+                rows_processed = self.rows_processed + row_count
+                self.write({
+                    'groups_done': self.groups_done + group_count,
+                    'moves_created': self.moves_created + len(moves),
+                    'rows_processed': rows_processed,
+                    'duration': duration,
+                    'rows_per_second': duration and rows_processed / duration or 0.0,
+                })
+                self.env.cr.commit()
+                self.env.invalidate_all()
+                if now - started > time_limit:
+                    return False
+            self.write({'state': 'done', 'date_end': fields.Datetime.now()})
+            self.env.cr.commit()
+        except Exception as e:
+            self._fail(e)
+        return True
+
+    @api.model
+    def _cron_process_jobs(self, time_limit=None):
+        """Process the pending import jobs for at most ``time_limit`` seconds
+        and re-trigger the crons when some are left.
+
+        Several copies of the cron may run this at the same time, each job
+        being processed by the first one locking it.
+        """
+        if time_limit is None:
+            time_limit = int(self.env['ir.config_parameter'].sudo().get_param(
+                'import_multiple_journal_entry.job_time_limit', 240))
+        started = time.time()
+        jobs = self.search([('state', 'in', ('queued', 'running')), ('is_split', '=', False)], order='id')
+        for job in jobs:
+            remaining = time_limit - (time.time() - started)
+            if remaining <= 0 or not job._process(remaining):
+                break
+        self._close_split_jobs()
+        if self.search_count([('state', 'in', ('queued', 'running'))]):
+            self._trigger_workers()
+
+    @api.model
+    def _close_split_jobs(self):
+        """Mark the split jobs whose partitions are all finished as done, or
+        failed when one of them failed, with the totals of the partitions."""
+        for job in self.search([('state', 'in', ('queued', 'running')), ('is_split', '=', True)]):
+            if any(child.state in ('queued', 'running') for child in job.child_ids) or not job._try_lock():
+                continue
+            try:
+                # read the partitions again in a transaction started once locked
+                self.env.cr.commit()
+                self.env.invalidate_all()
+                children = job.child_ids
+                if job.state not in ('queued', 'running') or any(
+                        child.state in ('queued', 'running') for child in children):
+                    continue
+                failed = children.filtered(lambda child: child.state == 'failed')
+                date_end = fields.Datetime.now()
+                duration = (date_end - (job.date_start or date_end)).total_seconds()
+                rows_processed = sum(children.mapped('rows_processed'))
+                job.write({
+                    'state': failed and 'failed' or 'done',
+                    'date_end': date_end,
+                    'rows_processed': rows_processed,
+                    'moves_created': sum(children.mapped('moves_created')),
+                    'duration': duration,
+                    'rows_per_second': duration and rows_processed / duration or 0.0,
+                    'error_log': '\n'.join('%s: %s' % (child.name, child.error_log) for child in failed) or False,
+                })
+                self.env.cr.commit()
+            finally:
+                job._unlock()
+
+    @api.model
+    def _get_worker_crons(self):
+        """Return the active crons processing the jobs, at most one per
+        parallel job allowed.
+
+        A cron is only run by one cron worker at a time, so the module ships
+        several copies of its cron for as many cron workers
+        (``--max-cron-threads``) to process jobs at the same time, in their
+        own process and cursor. ``import_multiple_journal_entry.max_parallel_jobs``
+        limits how many of them are used; archiving some limits it as well.
+        """
+        cron = self.env.ref('import_multiple_journal_entry.ir_cron_process_journal_import_jobs').sudo()
+        count = max(int(self.env['ir.config_parameter'].sudo().get_param(
+            'import_multiple_journal_entry.max_parallel_jobs', 4)), 1)
+        return cron.with_context(active_test=True).search([
+            ('model_id', '=', cron.model_id.id),
+            ('code', '=', cron.code),
+        ], order='id', limit=count)
+
+    @api.model
+    def _trigger_workers(self, count=None):
+        for cron in self._get_worker_crons()[:count]:
+            cron._trigger()
+
+    def action_retry(self):
+        jobs = self.filtered(lambda job: job.state == 'failed')
+        # a split job is retried through its failed partitions
+        jobs |= jobs.child_ids | jobs.parent_id
+        jobs.filtered(lambda job: job.state == 'failed').write({'state': 'queued', 'error_log': False})
+        self._trigger_workers()
@@ -0,0 +1,7 @@
+# -*- coding: utf-8 -*-
+# Part of BrowseInfo. See LICENSE file for full copyright and licensing details.
+
+from . import test_import_benchmark
+from . import test_import_validation
+from . import test_import_lookups
+from . import test_import_reader
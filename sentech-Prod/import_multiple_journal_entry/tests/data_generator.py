@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+# Part of BrowseInfo. See LICENSE file for full copyright and licensing details.
+
+"""Synthetic journal entry files for the importer benchmarks.
+
+:func:`create_master_data` creates the partners, accounts, currencies and the
+journal referenced by the generated files (:func:`find_master_data` finds them
+again), :func:`generate_rows` produces N balanced lines spread over M refs, and
+:func:`to_csv` / :func:`to_xlsx` encode them as an upload of the wizard (XLSX
+files are accepted by the XLS option).
+"""
+
+import base64
+import csv
+import io
+import random
+
+HEADER = ['date', 'Ref', 'Journal', 'name', 'partner', 'analytic_account_id', 'account', 'date_maturity',
+          'debit', 'credit', 'amount_currency', 'currency']
+
+
+def create_master_data(env, count=10, company=None, prefix='BENCH'):
+    """Create ``count`` partners and accounts and activate up to ``count``
+    currencies, return the names and codes used by :func:`generate_rows`."""
+    company = company or env.company
+    partners = env['res.partner'].create([{'name': '%s Partner %s' % (prefix, i)} for i in range(count)])
+    accounts = env['account.account'].with_company(company).create([{
+        'name': '%s Account %s' % (prefix, i),
+        'code': '9%05d' % i,
+        'account_type': 'asset_current',
+    } for i in range(count)])
+    currencies = company.currency_id | env['res.currency'].with_context(active_test=False).search(
+        [('id', '!=', company.currency_id.id)], limit=count - 1)
+    currencies.active = True
+    journal = env['account.journal'].create({
+        'name': '%s Journal' % prefix,
+        'code': prefix[:5],
+        'type': 'general',
+        'company_id': company.id,
+    })
+    return {
+        'partners': partners.mapped('name'),
+        'accounts': accounts.mapped('code'),
+        'currencies': currencies.mapped('name'),
+        'journal': journal.name,
+    }
+
+
+def find_master_data(env, count=10, company=None, prefix='BENCH'):
+    """Return the master data created by :func:`create_master_data` with the
+    same ``prefix``, or None if it was not created yet."""
+    company = company or env.company
+    journal = env['account.journal'].search([('code', '=', prefix[:5]), ('company_id', '=', company.id)], limit=1)
+    if not journal:
+        return None
+    partners = env['res.partner'].search([('name', '=like', '%s Partner %%' % prefix)], order='id', limit=count)
+    accounts = env['account.account'].with_company(company).search(
+        [('name', '=like', '%s Account %%' % prefix)] + env['account.account']._check_company_domain(company),
+        order='id', limit=count)
+    currencies = company.currency_id | env['res.currency'].search(
+        [('id', '!=', company.currency_id.id)], limit=count - 1)
+    return {
+        'partners': partners.mapped('name'),
+        'accounts': accounts.mapped('code'),
+        'currencies': currencies.mapped('name'),
+        'journal': journal.name,
+    }
+
+
+def generate_rows(master_data, lines=1000, refs=250, seed=42, year=2024):
+    """Yield ``lines`` rows spread over ``refs`` balanced entries, with the
+    column order of the sample files."""
+    rng = random.Random(seed)
+    refs = max(min(refs, lines // 2), 1)
+    per_ref, extra = divmod(lines, refs)
+    for ref_no in range(refs):
+        ref = 'BENCH/%s/%06d' % (year, ref_no)
+        date = '%s-%02d-%02d' % (year, ref_no % 12 + 1, ref_no % 28 + 1)
+        partner = rng.choice(master_data['partners'])
+        currency = rng.choice(master_data['currencies'])
+        count = per_ref + (ref_no < extra and 1 or 0)
+        total = 0.0
+        for line_no in range(count):
+            if line_no < count - 1:
+                amount = round(rng.uniform(1, 10000), 2)
+                total += amount
+                debit, credit, amount_currency = amount, 0, amount
+            else:
+                # the last line balances the entry
+                amount = round(total, 2)
+                debit, credit, amount_currency = 0, amount, -amount
+            yield [
+                date, ref, master_data['journal'], 'Line %s' % line_no, partner, '',
+                rng.choice(master_data['accounts']), date, debit, credit, amount_currency, currency,
+            ]
+
+
+def to_csv(rows):
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(HEADER)
+    writer.writerows(rows)
+    return base64.b64encode(out.getvalue().encode('utf-8'))
+
+
+def to_xlsx(rows):
+    import xlsxwriter
+    out = io.BytesIO()
+    workbook = xlsxwriter.Workbook(out, {'in_memory': True})
+    sheet = workbook.add_worksheet()
+    sheet.write_row(0, 0, HEADER)
+    for row_no, row in enumerate(rows, 1):
+        sheet.write_row(row_no, 0, row)
+    workbook.close()
+    return base64.b64encode(out.getvalue())
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+# Part of BrowseInfo. See LICENSE file for full copyright and licensing details.
+
+import logging
+import resource
+import time
+
+from odoo.tests import tagged
+from odoo.tests.common import TransactionCase
+
+from . import data_generator
+
+_logger = logging.getLogger(__name__)
+
+
+@tagged('post_install', '-at_install', '-standard', 'import_benchmark')
+class TestImportBenchmark(TransactionCase):
+    """Query count, wall time and peak RSS of ``import_move_lines``.
+
+    Not part of the standard tests, run with ``--test-tags import_benchmark``.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.company = cls.env.company
+        cls.master_data = data_generator.create_master_data(cls.env, count=20, company=cls.company)
+
+    def _benchmark(self, lines, refs, file_format='csv'):
+        rows = data_generator.generate_rows(self.master_data, lines=lines, refs=refs)
+        payload = file_format == 'csv' and data_generator.to_csv(rows) or data_generator.to_xlsx(rows)
+        wizard = self.env['gen.journal.entry'].create({
+            'file_to_upload': payload,
+            'import_option': file_format == 'csv' and 'csv' or 'xls',
+            'company_id': self.company.id,
+        })
+        self.env.flush_all()
+        queries = self.env.cr.sql_log_count
+        started = time.time()
+        wizard.import_move_lines()
+        self.env.flush_all()
+        elapsed = time.time() - started
+        queries = self.env.cr.sql_log_count - queries
+        # ru_maxrss is the peak of the whole process, in kilobytes on Linux
+        peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+        _logger.info(
+            'Imported %s %s lines (%s entries): %.2fs, %.0f lines/s, %s queries, peak RSS %.0f MB',
+            lines, file_format, refs, elapsed, lines / elapsed, queries, peak_rss)
+        moves = self.env['account.move'].search_count([('ref', '=like', 'BENCH/%')])
+        self.assertEqual(moves, refs)
+
+    def _benchmark_validation(self, lines, refs):
+        rows = data_generator.generate_rows(self.master_data, lines=lines, refs=refs)
+        wizard = self.env['gen.journal.entry'].create({
+            'file_to_upload': data_generator.to_csv(rows),
+            'import_option': 'csv',
+            'company_id': self.company.id,
+        })
+        started = time.process_time()
+        report = wizard._validate_import()
+        cpu = time.process_time() - started
+        _logger.info(
+            'Validated %s csv lines (%s entries): %.2fs CPU before writing, parse and validation %.2fs',
+            lines, refs, cpu, report['timings']['parse'])
+        self.assertFalse(report['errors'])
+        self.assertEqual(report['moves_to_create'], refs)
+
+    def test_validate_100k(self):
+        self._benchmark_validation(100000, 25000)
+
+    def test_import_1k(self):
+        self._benchmark(1000, 250)
+
+    def test_import_1k_xlsx(self):
+        self._benchmark(1000, 250, file_format='xlsx')
+
+    def test_import_10k(self):
+        self._benchmark(10000, 2500)
+
+    def test_import_100k(self):
+        self._benchmark(100000, 25000)
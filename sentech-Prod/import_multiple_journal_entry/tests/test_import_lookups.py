@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+# Part of BrowseInfo. See LICENSE file for full copyright and licensing details.
+
+from odoo.exceptions import ValidationError
+from odoo.tests import tagged
+from odoo.tests.common import TransactionCase
+
+from . import data_generator
+
+
+@tagged('post_install', '-at_install')
+class TestImportLookups(TransactionCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.company = cls.env.company
+        cls.master_data = data_generator.create_master_data(cls.env, count=2, company=cls.company, prefix='LKP')
+        plan = cls.env['account.analytic.plan'].create({'name': 'LKP Plan'})
+        cls.analytic = cls.env['account.analytic.account'].create({'name': 'LKP Analytic', 'plan_id': plan.id})
+
+    def _wizard(self, rows):
+        return self.env['gen.journal.entry'].create({
+            'file_to_upload': data_generator.to_csv(rows),
+            'import_option': 'csv',
+            'company_id': self.company.id,
+        })
+
+    def _line(self, ref, debit, credit, journal=None, account=None, currency=None, analytic=''):
+        master_data = self.master_data
+        return [
+            '2024-01-31', ref, journal or master_data['journal'], 'Line', master_data['partners'][0], analytic,
+            account or master_data['accounts'][0], '', debit, credit, '', currency or master_data['currencies'][0],
+        ]
+
+    def test_resolve(self):
+        wizard = self._wizard([
+            self._line('LKP/1', 10, 0),
+            self._line('LKP/1', 0, 10, account=self.master_data['accounts'][1] + '.0'),
+        ])
+        wizard.import_move_lines()
+        move = self.env['account.move'].search([('ref', '=', 'LKP/1')])
+        self.assertEqual(move.journal_id.name, self.master_data['journal'])
+        self.assertEqual(set(move.line_ids.account_id.mapped('code')), set(self.master_data['accounts']))
+        self.assertEqual(move.line_ids.partner_id.name, self.master_data['partners'][0])
+
+    def test_existing_move(self):
+        """Lines of a ref already imported go onto its move, whatever the date notation."""
+        self._wizard([
+            self._line('LKP/4', 10, 0),
+            self._line('LKP/4', 0, 10),
+        ]).import_move_lines()
+        move = self.env['account.move'].search([('ref', '=', 'LKP/4')])
+        self.assertEqual(len(move.line_ids), 2)
+        line = self._line('LKP/4', 5, 0)
+        line[0] = '2024-1-31'
+        self._wizard([line, self._line('LKP/4', 0, 5)]).import_move_lines()
+        self.assertEqual(self.env['account.move'].search([('ref', '=', 'LKP/4')]), move)
+        self.assertEqual(len(move.line_ids), 4)
+
+    def test_unknown_codes(self):
+        """Every unknown reference of the file is reported in one error."""
+        wizard = self._wizard([
+            self._line('LKP/2', 10, 0, account='LKP404', analytic='LKP Missing Analytic'),
+            self._line('LKP/2', 0, 10, currency='XZZ'),
+            self._line('LKP/3', 10, 0, journal='LKP Missing Journal'),
+            self._line('LKP/3', 0, 10, account='LKP405', analytic='LKP Analytic'),
+        ])
+        with self.assertRaises(ValidationError) as capture:
+            wizard.import_move_lines()
+        message = str(capture.exception)
+        for error in [
+            '"XZZ" Currency is not  in the system',
+            '"LKP404" Wrong Account Code',
+            '"LKP405" Wrong Account Code',
+            '"LKP Missing Analytic" Wrong Analytic Account Name',
+            'Please Define Journal which are already in system. (LKP Missing Journal)',
+        ]:
+            self.assertIn(error, message)
+        # the known references are not reported
+        self.assertNotIn(self.master_data['accounts'][0], message)
+        self.assertNotIn('"LKP Analytic"', message)
+        self.assertFalse(self.env['account.move'].search([('ref', 'in', ['LKP/2', 'LKP/3'])]))
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+# Part of BrowseInfo. See LICENSE file for full copyright and licensing details.
+
+import base64
+import io
+import random
+
+from odoo.tests import tagged
+from odoo.tests.common import TransactionCase
+
+from ..wizard import import_reader
+
+
+@tagged('post_install', '-at_install')
+class TestImportReader(TransactionCase):
+
+    def _read(self, payload, chunk_size, read_size=None):
+        stream = import_reader.Base64Stream(payload, chunk_size=chunk_size)
+        if read_size is None:
+            return io.BufferedReader(stream).read()
+        chunks = []
+        buffer = bytearray(read_size)
+        while True:
+            size = stream.readinto(buffer)
+            if not size:
+                return b''.join(chunks)
+            chunks.append(bytes(buffer[:size]))
+
+    def test_base64_stream(self):
+        rng = random.Random(7)
+        for length in [0, 1, 2, 3, 4, 5, 47, 48, 49, 1000]:
+            content = bytes(rng.randrange(256) for i in range(length))
+            payload = base64.b64encode(content)
+            for chunk_size in [4, 8, 12, 64]:
+                self.assertEqual(self._read(payload, chunk_size), content, (length, chunk_size))
+                self.assertEqual(self._read(payload.decode(), chunk_size, read_size=5), content, (length, chunk_size))
+
+    def test_base64_stream_line_breaks(self):
+        # encodebytes splits the payload in lines of 76 characters
+        content = bytes(range(256)) * 3
+        payload = base64.encodebytes(content)
+        for chunk_size in [4, 8, 12, 64, 76, 80]:
+            self.assertEqual(self._read(payload, chunk_size), content, chunk_size)
+
+    def test_csv_multibyte(self):
+        # multibyte characters split over decoded chunks
+        text = 'date,Ref\n' + ''.join('2024-01-%02d,Réf €%s\n' % (i % 28 + 1, i) for i in range(50))
+        payload = base64.b64encode(text.encode('utf-8'))
+        stream = io.TextIOWrapper(
+            io.BufferedReader(import_reader.Base64Stream(payload, chunk_size=8), buffer_size=3), encoding='utf-8')
+        self.assertEqual(stream.read(), text)
+        rows = list(import_reader.iter_csv_rows(payload, keys=['date', 'ref']))
+        self.assertEqual(len(rows), 50)
+        self.assertEqual(rows[49], {'date': '2024-01-22', 'ref': 'Réf €49'})
+
+    def _ods_payload(self, rows):
+        """Return an ODS file of ``rows``, lists of ``(text, cell attributes)``
+        preceded by the row attributes."""
+        from odf.opendocument import OpenDocumentSpreadsheet
+        from odf.table import Table, TableCell, TableRow
+        from odf.text import P
+        document = OpenDocumentSpreadsheet()
+        table = Table(name='Journal Items')
+        for row_attributes, *cells in rows:
+            row = TableRow(**row_attributes)
+            for text, attributes in cells:
+                cell = TableCell(**attributes)
+                if text:
+                    cell.addElement(P(text=text))
+                row.addElement(cell)
+            table.addElement(row)
+        document.spreadsheet.addElement(table)
+        content = io.BytesIO()
+        document.write(content)
+        return base64.b64encode(content.getvalue())
+
+    def test_ods_values(self):
+        if import_reader.ODSReader is None:
+            self.skipTest('odfpy is not installed')
+        payload = self._ods_payload([
+            [{}, ('date', {}), ('Ref', {}), ('debit', {})],
+            # the texts are displayed with the formats of the sheet
+            [{}, ('31/01/2024', {'valuetype': 'date', 'datevalue': '2024-01-31'}),
+             ('0042', {'valuetype': 'string'}),
+             ('1,234.50 €', {'valuetype': 'currency', 'value': '1234.5', 'currency': 'EUR'}),
+             ('', {'numbercolumnsrepeated': '16384'})],
+            [{'numberrowsrepeated': '2'}, ('01/02/24 10:30', {'valuetype': 'date', 'datevalue': '2024-02-01T10:30:00'}),
+             ('R2', {}), ('1.2E+3', {'valuetype': 'float', 'value': '1200'})],
+            [{'numberrowsrepeated': '1048570'}, ('', {'numbercolumnsrepeated': '16384'})],
+        ])
+        rows = list(import_reader.iter_ods_rows(payload, keys=['date', 'ref', 'debit']))
+        self.assertEqual(rows, [
+            {'date': '2024-01-31', 'ref': '0042', 'debit': '1234.5'},
+            {'date': '2024-02-01', 'ref': 'R2', 'debit': '1200'},
+            {'date': '2024-02-01', 'ref': 'R2', 'debit': '1200'},
+        ])
+
+    def _rows(self, count, refs, seed=3):
+        rng = random.Random(seed)
+        return [{'ref': 'R%03d' % rng.randrange(refs), 'line': i, 'debit': rng.uniform(0, 100), 'name': 'Ligne é'}
+                for i in range(count)]
+
+    def _groups(self, rows, max_rows_in_memory):
+        return [(ref, group) for ref, group in import_reader.group_rows_by_ref(iter(rows), max_rows_in_memory)]
+
+    def test_group_rows_by_ref(self):
+        rows = self._rows(200, 30)
+        in_memory = self._groups(rows, len(rows) + 1)
+        self.assertEqual([ref for ref, group in in_memory], sorted({row['ref'] for row in rows}))
+        for ref, group in in_memory:
+            self.assertTrue(all(row['ref'] == ref for row in group))
+            # file order within a group
+            self.assertEqual([row['line'] for row in group], sorted(row['line'] for row in group))
+        self.assertEqual(sum(len(group) for ref, group in in_memory), len(rows))
+        # spilled to sorted runs of 1, 2, 7 rows and merged
+        for max_rows_in_memory in [1, 2, 7, len(rows)]:
+            self.assertEqual(self._groups(rows, max_rows_in_memory), in_memory, max_rows_in_memory)
+
+    def test_group_rows_by_ref_empty(self):
+        self.assertEqual(self._groups([], 2), [])
+        self.assertEqual(self._groups([{'ref': 'A'}], 1), [('A', [{'ref': 'A'}])])
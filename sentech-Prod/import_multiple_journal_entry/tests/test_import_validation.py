@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+# Part of BrowseInfo. See LICENSE file for full copyright and licensing details.
+
+from odoo.tests import tagged
+from odoo.tests.common import TransactionCase
+
+from ..wizard.import_validation import ImportValidator
+from . import data_generator
+
+
+def _row(ref='R1', debit='', credit='', date='2024-01-31', **values):
+    row = {
+        'date': date, 'ref': ref, 'journal': 'Misc', 'name': 'Line', 'partner': '', 'analytic_account_id': '',
+        'account_code': '100000', 'date_maturity': '', 'debit': debit, 'credit': credit,
+        'amount_currency': '', 'currency': '',
+    }
+    row.update(values)
+    return row
+
+
+@tagged('post_install', '-at_install')
+class TestImportValidation(TransactionCase):
+
+    def _validate(self, rows, block_size=2):
+        validator = ImportValidator(block_size=block_size)
+        rows = list(validator.feed(rows))
+        return rows, validator.finish()
+
+    def test_normalise(self):
+        rows, errors = self._validate([
+            _row(debit='100.5', credit='', name='', date='2024-01-31 10:00:00', date_maturity='2024-02-29'),
+            _row(debit='', credit='100.5', amount_currency='-12'),
+        ])
+        self.assertEqual(errors, [])
+        self.assertEqual(rows[0]['debit'], 100.5)
+        self.assertEqual(rows[0]['credit'], 0.0)
+        self.assertEqual(rows[0]['name'], '/')
+        self.assertEqual(rows[0]['date'], '2024-01-31')
+        self.assertEqual(rows[0]['date_maturity'], '2024-02-29')
+        self.assertEqual(rows[1]['credit'], 100.5)
+        self.assertEqual(rows[1]['amount_currency'], -12.0)
+
+    def test_negative_amount_swap(self):
+        rows, errors = self._validate([
+            _row(debit='-40', credit=''),
+            _row(debit='', credit='-40'),
+        ])
+        self.assertEqual(errors, [])
+        self.assertEqual((rows[0]['debit'], rows[0]['credit']), (0.0, 40.0))
+        self.assertEqual((rows[1]['debit'], rows[1]['credit']), (40.0, 0.0))
+
+    def test_line_errors(self):
+        # spread over several blocks, the header being line 1
+        rows, errors = self._validate([
+            _row(debit='10'),
+            _row(credit='10'),
+            _row(ref='R2', debit='abc'),
+            _row(ref='R2', credit='0', date='31/01/2024'),
+            _row(ref='R3', debit='5', date=''),
+            _row(ref='R3', credit='5'),
+        ])
+        self.assertEqual(len(rows), 6)
+        self.assertEqual(errors, [
+            'Line 4: "abc" is not a valid amount for debit.',
+            'Line 5: Wrong Date Format. Date Should be in format YYYY-MM-DD.',
+            'Line 6: Define Date or Amount In Corresponding Columns !!!',
+        ])
+
+    def test_unbalanced(self):
+        rows, errors = self._validate([
+            _row(ref='R1', debit='100'),
+            _row(ref='R2', debit='30'),
+            _row(ref='R1', credit='99.99'),
+            _row(ref='R2', credit='10'),
+            _row(ref='R2', credit='20.004'),
+        ])
+        # R2 balances at the currency precision
+        self.assertEqual(errors, ['R1: the entry is not balanced (debit 100.0, credit 99.99).'])
+
+    def test_wizard_report(self):
+        # the wizard reports the same errors before anything is written, an
+        # existing journal making it look up the existing moves
+        master_data = data_generator.create_master_data(self.env, count=2, prefix='VAL')
+        journal, accounts = master_data['journal'], master_data['accounts']
+        rows = [
+            ['2024-01-31', 'R1', journal, 'Line', '', '', accounts[0], '', -15, '', '', ''],
+            ['2024-13-01', 'R1', journal, 'Line', '', '', accounts[1], '', '', -10, '', ''],
+            ['31/01/2024', 'R2', journal, 'Line', '', '', accounts[0], '', 10, '', '', ''],
+            ['2024-01-31', 'R2', journal, 'Line', '', '', accounts[1], '', '', 10, '', ''],
+        ]
+        wizard = self.env['gen.journal.entry'].create({
+            'file_to_upload': data_generator.to_csv(rows),
+            'import_option': 'csv',
+        })
+        report = wizard._validate_import()
+        self.assertIn('Line 3: Wrong Date Format. Date Should be in format YYYY-MM-DD.', report['errors'])
+        self.assertIn('Line 4: Wrong Date Format. Date Should be in format YYYY-MM-DD.', report['errors'])
+        self.assertIn('R1: the entry is not balanced (debit 10.0, credit 15.0).', report['errors'])
+        self.assertEqual(report['rows'], 4)
+        self.assertEqual(report['moves_to_create'], 2)
+        wizard.action_validate_import()
+        self.assertIn('Line 3: Wrong Date Format.', wizard.validation_report)
@@ -2,305 +2,355 @@
 # Part of BrowseInfo. See LICENSE file for full copyright and licensing details.
 
 import time
-import json
-import io
-import datetime
-import tempfile
 import binascii
-import xlrd
-import itertools
-from odoo.tools import DEFAULT_SERVER_DATETIME_FORMAT, DEFAULT_SERVER_DATE_FORMAT
-from datetime import date, datetime
 from odoo.exceptions import UserError, ValidationError
-from odoo import models, fields, api, _, exceptions
+from odoo import models, fields, _
+from . import import_reader
+from .import_validation import ImportValidator
 import logging
-from operator import itemgetter
 _logger = logging.getLogger(__name__)
 
 try:
         import csv
 except ImportError:
         _logger.debug('Cannot `import csv`.')
-try:
-        import base64
-except ImportError:
-        _logger.debug('Cannot `import base64`.')
 
 class gen_journal_entry(models.TransientModel):
     _name = "gen.journal.entry"
     
     file_to_upload = fields.Binary('File')
-    import_option = fields.Selection([('csv', 'CSV File'),('xls', 'XLS File')],string='Select',default='csv')
+    import_option = fields.Selection([('csv', 'CSV File'),('xls', 'XLS File'),('xlsx', 'XLSX File'),('ods', 'ODS File')],string='Select',default='csv')
     company_id = fields.Many2one('res.company',string="Company",default=lambda self: self.env.user.company_id)
+    bulk_create = fields.Boolean(string="Bulk Create", default=True,
+                                 help="Create the journal entries with their lines in batches instead of one by one.")
+    chunk_size = fields.Integer(string="Batch Size", default=500,
+                                help="Number of journal entries created at once in bulk mode.")
+    commit_per_chunk = fields.Boolean(string="Commit Each Batch",
+                                      help="Commit the database transaction after each batch, so that very large "
+                                           "files do not hold everything in one transaction. Already committed "
+                                           "batches are kept if a later batch fails.")
+    run_in_background = fields.Boolean(string="Run in Background",
+                                       help="Store the file and import it from a scheduled job, in batches committed "
+                                            "one by one. The progress can be followed on the import job.")
+    validation_report = fields.Text(string="Validation Report", readonly=True)
+    worker_count = fields.Integer(string="Parallel Jobs", default=1,
+                                  help="Split the journal entries of the file into this many background jobs "
+                                       "processed in parallel by the cron workers, each in its own process.")
     
-    def find_account_id(self, account_code ):   
-        if account_code:
-            account_ids  = self.env['account.account'].search([('code', '=', account_code.split('.') )])
-            if account_ids:
-                account_id = account_ids[0]                     
-                return account_id
-            else:
-                raise ValidationError(_('"%s" Wrong Account Code') % (account_code))
-                
-    
-    def check_desc(self, name): 
-        if name:
-            return name
-        else:
-            return  '/' 
-    
-    def find_account_analytic_id(self, analytic_account_name):
-        analytic_account_id  = self.env['account.analytic.account'].search([('name', '=',analytic_account_name)])
-        if analytic_account_id:
-            analytic_account_id = analytic_account_id[0].id
-            return analytic_account_id  
-        else: 
-            raise ValidationError(_('"%s" Wrong Analytic Account Name') % (analytic_account_name))
-            
-    
-    def find_partner(self, partner_name):   
-        partner_ids = self.env['res.partner'].search([('name', '=', partner_name)])
-        if partner_ids:
-            partner_id  = partner_ids[0]
-            return partner_id
-        else:
-            partner_id = None       
-    
-    def check_currency(self, cur_name): 
-        currency_ids = self.env['res.currency'].search([('name', '=', cur_name)])
-        if currency_ids:
-            currency_id  = currency_ids[0]
-            return currency_id
-        else:
-            currency_id= None
-            return  currency_id
+    def _new_import_keys(self):
+        return {'rows': 0, 'errors': [], 'partner': set(), 'currency': set(), 'account': set(), 'analytic': set(),
+                'journal': set(), 'move': set()}
 
-    def create_import_move_lines(self, values):
-        move_line_obj = self.env['account.move.line']
-        move_obj = self.env['account.move']
-        if values.get('partner'):
-            partner_name = values.get('partner')  
-            if self.find_partner(partner_name) != None:
-                partner_id = self.find_partner(partner_name)
-                values.update({'partner_id': partner_id.id })
-              
-        if values.get('currency'):
-            cur_name = values.get('currency')
-            if cur_name  != '' and cur_name != None:    
-                currency_id  = self.check_currency(cur_name)
-                if currency_id != None :
-                    values.update({'currency_id': currency_id.id  })
-                else:
-                    raise ValidationError(_('"%s" Currency is not  in the system') % (cur_name))
-                    
-        if values.get('name'):
-            desc_name = values.get('name')  
-            name  = self.check_desc(desc_name)
-            values.update({'name': name })
+    def _collect_import_keys(self, rows, keys, validator):
+        """Pass ``rows`` normalised by ``validator`` through while recording the
+        master data keys they use. Rows with an invalid date give no move key."""
+        for row in rows:
+            keys['rows'] += 1
+            if row.get('partner'):
+                keys['partner'].add(row['partner'])
+            if row.get('currency'):
+                keys['currency'].add(row['currency'])
+            if row.get('account_code'):
+                keys['account'].add(str(row['account_code']))
+            if row.get('analytic_account_id'):
+                keys['analytic'].add(row['analytic_account_id'])
+            if row.get('journal'):
+                keys['journal'].add(row['journal'])
+                if validator.is_valid_date(row.get('date')):
+                    keys['move'].add(self._get_import_move_key(row))
+            yield row
 
-        if values.get('date_maturity'):
-            date = self.find_date(values.get('date_maturity'))  
-            values.update({'date_maturity': date })
+    def _resolve_import_keys(self, keys, raise_errors=True):
+        company = self.company_id or self.env.company
+        account_codes = set()
+        for row_code in keys['account']:
+            account_codes.update(row_code.split('.'))
 
-        if values.get('date'):
-            date = self.find_date(values.get('date'))
+        lookups = {'partner': {}, 'currency': {}, 'account': {}, 'analytic': {}, 'journal': {}, 'move': {}}
+        if keys['partner']:
+            Partner = self.env['res.partner']
+            for rec in Partner.search_read(
+                    [('name', 'in', list(keys['partner']))] + Partner._check_company_domain(company), ['name']):
+                lookups['partner'].setdefault(rec['name'], rec['id'])
+        if keys['currency']:
+            for rec in self.env['res.currency'].search_read([('name', 'in', list(keys['currency']))], ['name']):
+                lookups['currency'].setdefault(rec['name'], rec['id'])
+        if account_codes:
+            Account = self.env['account.account'].with_company(company)
+            for rec in Account.search_read(
+                    [('code', 'in', list(account_codes))] + Account._check_company_domain(company), ['code']):
+                lookups['account'].setdefault(rec['code'], rec['id'])
+        if keys['analytic']:
+            Analytic = self.env['account.analytic.account']
+            for rec in Analytic.search_read(
+                    [('name', 'in', list(keys['analytic']))] + Analytic._check_company_domain(company), ['name']):
+                lookups['analytic'].setdefault(rec['name'], rec['id'])
+        if keys['journal']:
+            for rec in self.env['account.journal'].sudo().search_read(
+                    [('name', 'in', list(keys['journal'])), ('company_id', '=', company.id)], ['name']):
+                lookups['journal'].setdefault(rec['name'], rec['id'])
+        if lookups['journal'] and keys['move']:
+            # one query on the union of the keys, then keep the exact (date, ref, journal) matches
+            move_keys = {(date, ref, lookups['journal'].get(journal)) for date, ref, journal in keys['move']}
+            for rec in self.env['account.move'].search_read([
+                    ('date', 'in', list({key[0] for key in move_keys})),
+                    ('ref', 'in', list({key[1] for key in move_keys})),
+                    ('journal_id', 'in', list(lookups['journal'].values()))], ['date', 'ref', 'journal_id']):
+                key = (fields.Date.to_string(rec['date']), rec['ref'], rec['journal_id'][0])
+                if key in move_keys:
+                    lookups['move'].setdefault(key, rec['id'])
 
-        if values.get('account_code'):
-            account_code = values.get('account_code') 
-            account_id  = self.find_account_id(str(account_code))
-            if account_id != None:
-                values.update({'account_id': account_id.id })
-            else:
-                raise ValidationError(_('"%s" Wrong Account Code') % (account_code))
+        errors = keys['errors']
+        for cur_name in sorted(keys['currency'] - set(lookups['currency'])):
+            errors.append(_('"%s" Currency is not  in the system') % (cur_name))
+        for row_code in sorted(keys['account']):
+            if not self._get_import_account_id(row_code, lookups):
+                errors.append(_('"%s" Wrong Account Code') % (row_code))
+        for analytic_name in sorted(keys['analytic'] - set(lookups['analytic'])):
+            errors.append(_('"%s" Wrong Analytic Account Name') % (analytic_name))
+        unknown_journals = keys['journal'] - set(lookups['journal'])
+        if unknown_journals:
+            errors.append('%s (%s)' % (_('Please Define Journal which are already in system.'),
+                                       ', '.join(sorted(unknown_journals))))
+        if errors and raise_errors:
+            raise ValidationError('\n'.join(errors))
+        return lookups
 
-        if values.get('debit') != '':
-            values.update({'debit' : float(values.get('debit')) })      
-            if float(values.get('debit')) <0 :
-                values.update({'credit' : abs(values.get('debit')) })
-                values.update({'debit' : 0.0 })     
-        else:
-            values.update({'debit' : float('0.0') })
+    def _get_import_account_id(self, account_code, lookups):
+        # XLS cells hold codes as floats ("200110.0"), match any dotted part
+        for code in str(account_code).split('.'):
+            if code in lookups['account']:
+                return lookups['account'][code]
+        return False
 
-        if values.get('name') == '':
-            values.update({'name' : '/' })      
+    def _get_max_rows_in_memory(self):
+        return int(self.env['ir.config_parameter'].sudo().get_param(
+            'import_multiple_journal_entry.max_rows_in_memory', import_reader.MAX_ROWS_IN_MEMORY))
 
-        if values.get('credit') != '':
-            values.update({'credit' : float(values.get('credit')) })
-            if float(values.get('credit')) <0 :
-                values.update({'debit' : abs(values.get('credit')) })
-                values.update({'credit':0.0})       
-        else:
-            values.update({'credit' : float('0.0') })
+    def _iter_import_rows(self, stats=None):
+        """Return a generator over the rows of the uploaded file.
 
-        if values.get('amount_currency') != '':
-            values.update({'amount_currency' : float(values.get('amount_currency')) })
+        :param stats: optional dict in which the time spent decoding the
+            upload is accumulated under ``decode``
+        """
+        if self.import_option == 'csv':
+            return import_reader.iter_csv_rows(self.file_to_upload, stats=stats)
+        if self.import_option == 'ods':
+            return import_reader.iter_ods_rows(self.file_to_upload, stats=stats)
+        # XLSX files are often uploaded with the XLS option
+        if self.import_option == 'xlsx' or import_reader.is_xlsx(self.file_to_upload):
+            return import_reader.iter_xlsx_rows(self.file_to_upload, stats=stats)
+        return import_reader.iter_xls_rows(self.file_to_upload, stats=stats)
 
-        if values.get('analytic_account_id') != '':
-            account_anlytic_account = values.get('analytic_account_id')
-            if account_anlytic_account != '' or account_anlytic_account == None:
-                analytic_account_id  = self.find_account_analytic_id(account_anlytic_account)        
-                values.update({'analytic_account_id' : analytic_account_id })
-            else:
-                raise ValidationError(_('"%s" Wrong Account Code') % (account_anlytic_account))    
+    def _group_import_rows(self, keys, stats=None):
+        """Read the upload and group its rows by ``ref``.
 
-        return values
+        The whole file is consumed (and ``keys`` filled) before the groups are
+        returned, but never more than one decoded copy of it is held in memory.
+        """
+        validator = self._get_import_validator()
+        rows = self._collect_import_keys(validator.feed(self._iter_import_rows(stats)), keys, validator)
+        try:
+            groups = import_reader.group_rows_by_ref(rows, self._get_max_rows_in_memory())
+        except (UnicodeDecodeError, binascii.Error, csv.Error, import_reader.ImportFileError):
+            raise ValidationError(_("Invalid file!"))
+        except ImportError as e:
+            raise UserError(str(e))
+        keys['errors'].extend(validator.finish())
+        return groups
 
-    def find_date(self,date):
-        DATETIME_FORMAT = "%Y-%m-%d"
-        if date:
-            new_date = date.split(' ')
-            try:
-                p_date = datetime.strptime(new_date[0],DATETIME_FORMAT)
-                return p_date
-            except Exception:
-                raise ValidationError(_('Wrong Date Format. Date Should be in format YYYY-MM-DD.'))
-        else:
-            raise ValidationError(_('Please add Date field in sheet.'))
+    def _get_import_validator(self):
+        company = self.company_id or self.env.company
+        return ImportValidator(digits=company.currency_id.decimal_places, messages={
+            'amount': _('Line %(line)s: "%(value)s" is not a valid amount for %(column)s.'),
+            'date': _('Line %(line)s: Wrong Date Format. Date Should be in format YYYY-MM-DD.'),
+            'missing_date': _('Line %(line)s: Define Date or Amount In Corresponding Columns !!!'),
+            'unbalanced': _('%(ref)s: the entry is not balanced (debit %(debit)s, credit %(credit)s).'),
+        })
 
-    def import_move_lines (self):
-        if  self.import_option == 'csv':
-            keys = ['date','ref','journal','name','partner','analytic_account_id', 'account_code', 'date_maturity', 'debit', 'credit', 'amount_currency', 'currency']
-            try:
-                csv_data = base64.b64decode(self.file_to_upload)
-                data_file = io.StringIO(csv_data.decode("utf-8"))
-                data_file.seek(0)
-                file_reader = []
-                csv_reader = csv.reader(data_file, delimiter=',')           
-                file_reader.extend(csv_reader)
-            except Exception:
-                raise ValidationError(_("Invalid file!"))
+    def _get_import_move_key(self, val):
+        return (val.get('date', '').split(' ')[0], val.get('ref'), val.get('journal'))
+
+    def _get_import_move(self, val, lookups):
+        """Return the existing move matching ``val`` or the vals to create it."""
+        move_obj = self.env['account.move']
+        if not val.get('journal'):
+            raise ValidationError(_('Please Define Journal In Corresponding Columns !!!.'))
+        journal_id = lookups['journal'].get(val.get('journal'))
+        if not journal_id:
+            raise ValidationError(_('Please Define Journal which are already in system.'))
+        date, ref, journal = self._get_import_move_key(val)
+        move_id = lookups['move'].get((date, ref, journal_id))
+        if move_id:
+            return move_obj.browse(move_id), {}
+        return move_obj, {'date':val.get('date') or False,'ref':val.get('ref') or False,'journal_id':journal_id }
+
+    def _prepare_import_line(self, val, lookups):
+        """Return the move line values of a row normalised by the validator."""
+        res = dict(val)
+        partner = res.pop('partner')
+        currency = res.pop('currency')
+        account_code = res.pop('account_code')
+        del res['journal']
+        if partner and partner in lookups['partner']:
+            res['partner_id'] = lookups['partner'][partner]
+        if currency:
+            res['currency_id'] = lookups['currency'][currency]
+        if account_code:
+            res['account_id'] = self._get_import_account_id(account_code, lookups)
+        if res.get('analytic_account_id'):
+            res['analytic_account_id'] = lookups['analytic'][res['analytic_account_id']]
+        return res
+
+    def _create_import_moves(self, vals_list):
+        moves = self.env['account.move'].create(vals_list)
+        if self.commit_per_chunk:
+            self.env.cr.commit()
+            self.env.invalidate_all()
+        return moves
 
-            values = {}
-            lines = []  
-            data=[]
-            for i in range(len(file_reader)):
-                field = list(map(str, file_reader[i]))
-                values = dict(zip(keys, field))
-                if values:
-                    if i == 0:
-                        continue
-                    else:
-                        data.append(values)
+    def _iter_import_chunks(self, groups, lookups, dry_run=False):
+        """Yield ``(vals_list, group_count, row_count)`` batches of at most
+        ``chunk_size`` moves, each ``ref`` group giving one move with its lines
+        embedded in the create values. Groups matching an existing move are
+        written on it directly (unless ``dry_run``) and only counted in the
+        next batch.
+        """
+        chunk_size = max(self.chunk_size, 1)
+        vals_list = []
+        group_count = row_count = 0
+        for ref, group in groups:
+            lines = [(0, 0, self._prepare_import_line(val, lookups)) for val in group]
+            group_count += 1
+            row_count += len(group)
+            move, move_vals = self._get_import_move(group[0], lookups)
+            if move:
+                if not dry_run:
+                    move.write({'line_ids': lines})
+                continue
+            move_vals['line_ids'] = lines
+            vals_list.append(move_vals)
+            if len(vals_list) >= chunk_size:
+                yield vals_list, group_count, row_count
+                vals_list = []
+                group_count = row_count = 0
+        if group_count:
+            yield vals_list, group_count, row_count
 
-            data1= {}
-            sorted_data =sorted(data,key=lambda x:x['ref'])
-            list1 =[]
-            for key, group in itertools.groupby(sorted_data, key=lambda x:x['ref']):
-                small_list = []
-                for i in group:
-                    small_list.append(i)
-                    data1.update({key:small_list})
+    def _import_groups_bulk(self, groups, lookups):
+        for vals_list, group_count, row_count in self._iter_import_chunks(groups, lookups):
+            self._create_import_moves(vals_list)
 
-            for key in data1.keys():
-                lines=[]
-                values = data1.get(key)
-                for val in values: 
-                    res = self.create_import_move_lines(val)
-                    if not val.get('date') or not val.get('date_maturity'):
-                        raise ValidationError(_('Define Date or Amount In Corresponding Columns !!!'))
-                    move_obj = self.env['account.move']
-                    if  val.get('journal') :
-                        journal_search = self.env['account.journal'].sudo().search([('name','=',val.get('journal')),('company_id','=',self.company_id.id)])
-                        if journal_search:
-                            move1 = move_obj.search([('date','=',val.get('date')),
-                                                    ('ref', '=', val.get('ref')),
-                                                    ('journal_id', '=',journal_search.name)])
-                            if move1:
-                                move = move1
-                            else:
-                                move = move_obj.create({'date':val.get('date') or False,'ref':val.get('ref') or False,'journal_id':journal_search.id }) 
-                        else:
-                            raise ValidationError(_('Please Define Journal which are already in system.'))
-                    else:
-                        raise ValidationError(_('Please Define Journal In Corresponding Columns !!!.'))
-                    del res['journal'],res['partner'],res['account_code'],res['currency']
-                    lines.append((0,0,res))
-                move.write({'line_ids' : lines})    
+    def _prepare_import_job_vals(self):
+        return {
+            'import_option': self.import_option,
+            'company_id': self.company_id.id,
+            'chunk_size': max(self.chunk_size, 1),
+        }
+
+    def _enqueue_import_job(self):
+        vals = self._prepare_import_job_vals()
+        vals['partition_count'] = max(self.worker_count, 1)
+        job = self.env['gen.journal.entry.job'].create(vals)
+        job.attachment_id = self.env['ir.attachment'].create({
+            'name': job.name,
+            'datas': self.file_to_upload,
+            'res_model': job._name,
+            'res_id': job.id,
+        })
+        job._trigger_workers(1)
+        return {
+            'type': 'ir.actions.act_window',
+            'res_model': job._name,
+            'res_id': job.id,
+            'view_mode': 'form',
+            'target': 'current',
+        }
+
+    def _format_validation_report(self, report):
+        lines = [
+            _('Rows: %s') % report['rows'],
+            _('Journal entries to create: %s') % report['moves_to_create'],
+            _('Existing journal entries to complete: %s') % report['moves_to_update'],
+            '',
+            _('Time spent (seconds):'),
+        ]
+        for phase, label in [('decode', _('Decode')), ('parse', _('Parse')), ('resolve', _('Resolve')),
+                             ('build', _('Build')), ('write', _('Write'))]:
+            lines.append('  %s: %.3f' % (label, report['timings'][phase]))
+        if report['errors']:
+            lines += ['', _('Errors:')] + report['errors']
         else:
-            try:
-                fp = tempfile.NamedTemporaryFile(delete= False,suffix=".xlsx")
-                fp.write(binascii.a2b_base64(self.file_to_upload))
-                fp.seek(0)
-                values = {}
-                workbook = xlrd.open_workbook(fp.name)
-                sheet = workbook.sheet_by_index(0)
-            except Exception:
-                raise exceptions.ValidationError(_('Invalid File!!'))
-            product_obj = self.env['product.product']
-            lines = []
-            data  = []                
-            for row_no in range(sheet.nrows):
-                val = {}
-                if row_no <= 0:
-                    fields = map(lambda row:row.value.encode('utf-8'), sheet.row(row_no))
+            lines += ['', _('The file can be imported.')]
+        return '\n'.join(lines)
+
+    def _validate_import(self):
+        """Run the import up to the creation values without writing anything.
+
+        :return: dict with the row count, the number of moves that would be
+            created or completed, the errors and the time spent per phase
+        """
+        timings = dict.fromkeys(['decode', 'parse', 'resolve', 'build', 'write'], 0.0)
+        keys = self._new_import_keys()
+        start = time.time()
+        groups = self._group_import_rows(keys, stats=timings)
+        timings['parse'] = time.time() - start - timings['decode']
+        start = time.time()
+        lookups = self._resolve_import_keys(keys, raise_errors=False)
+        timings['resolve'] = time.time() - start
+        start = time.time()
+        moves_to_create = moves_to_update = 0
+        if keys['errors']:
+            # lines cannot be built on unresolved references, only count the entries
+            for ref, group in groups:
+                date, ref, journal = self._get_import_move_key(group[0])
+                if lookups['move'].get((date, ref, lookups['journal'].get(journal))):
+                    moves_to_update += 1
                 else:
-                    line = list(map(lambda row:isinstance(row.value, bytes) and row.value.encode('utf-8') or str(row.value), sheet.row(row_no)))
+                    moves_to_create += 1
+        else:
+            for vals_list, group_count, row_count in self._iter_import_chunks(groups, lookups, dry_run=True):
+                moves_to_create += len(vals_list)
+                moves_to_update += group_count - len(vals_list)
+        timings['build'] = time.time() - start
+        return {
+            'rows': keys['rows'],
+            'moves_to_create': moves_to_create,
+            'moves_to_update': moves_to_update,
+            'errors': keys['errors'],
+            'timings': timings,
+        }
 
-                    date  = False
-                    if line[7] != '' and line[0] !='':
-                        if line[7].split('/'):
-                            if len(line[7].split('/')) > 1:
-                                raise ValidationError(_('Wrong Date Format. Date Should be in format YYYY-MM-DD.'))
-                            if len(line[7]) > 8 or len(line[7]) < 5:
-                                raise ValidationError(_('Wrong Date Format. Date Should be in format YYYY-MM-DD.'))
-                        if line[0].split('/'):
-                            if len(line[0].split('/')) > 1:
-                                raise ValidationError(_('Wrong Date Format. Date Should be in format YYYY-MM-DD.'))
-                            if len(line[0]) > 8 or len(line[0]) < 5:
-                                raise ValidationError(_('Wrong Date Format. Date Should be in format YYYY-MM-DD.'))
-                        
-                        date = str(xlrd.xldate.xldate_as_datetime(int(float(line[7])), workbook.datemode))
-                        main_date = str(xlrd.xldate.xldate_as_datetime(int(float(line[0])), workbook.datemode)) 
-                        values =  {'date':main_date,
-                                    'ref':line[1],
-                                    'journal':line[2],
-                                    'name':line[3],
-                                    'partner': line[4],
-                                    'analytic_account_id': line[5],
-                                    'account_code': line[6],
-                                    'date_maturity':date,
-                                    'debit': line[8],
-                                    'credit': line[9],
-                                    'amount_currency': line[10],
-                                    'currency': line[11],
-                                }
-                        data.append(values)
-                    else:
-                        raise ValidationError(_('Define Date or Amount In Corresponding Columns !!!'))
-            data1= {}
-            
-            sorted_data =sorted(data,key=lambda x:x['ref'])
-            list1 =[]
-            for key, group in itertools.groupby(sorted_data, key=lambda x:x['ref']):
-                small_list = []
-                for i in group:
-                    small_list.append(i)
-                    data1.update({key:small_list})
+    def action_validate_import(self):
+        if not self.file_to_upload:
+            raise ValidationError(_("Invalid file!"))
+        self.validation_report = self._format_validation_report(self._validate_import())
+        return {
+            'type': 'ir.actions.act_window',
+            'res_model': self._name,
+            'res_id': self.id,
+            'view_mode': 'form',
+            'target': 'new',
+        }
 
-            for key in data1.keys():
-                lines=[]
-                values = data1.get(key)
-                for val in values: 
-                    res = self.create_import_move_lines(val)
-                    move_obj = self.env['account.move']
-                    if  val.get('journal') :
-                        journal_search = self.env['account.journal'].sudo().search([('name','=',val.get('journal')),('company_id','=',self.company_id.id)])
-                        if journal_search:
-                            move1 = move_obj.search([('date','=',val.get('date')),
-                                                    ('ref', '=', val.get('ref')),
-                                                    ('journal_id', '=',journal_search.name)])
-                            if move1:
-                                move = move1
-                            else:
-                                move = move_obj.create({
-                                    'date':val.get('date') or False,
-                                    'ref':val.get('ref') or False,
-                                    'journal_id':journal_search.id,
-                                    }) 
-                        else:
-                            raise ValidationError(_('Please Define Journal which are already in system.'))
-                    else:
-                        raise ValidationError(_('Please Define Journal In Corresponding Columns !!!.'))
-                    del res['journal'],res['partner'],res['account_code'],res['currency']
-                    lines.append((0,0,res))
-                move.write({'line_ids' : lines})
+    def import_move_lines (self):
+        if not self.file_to_upload:
+            raise ValidationError(_("Invalid file!"))
+        if self.run_in_background or self.worker_count > 1:
+            return self._enqueue_import_job()
+        keys = self._new_import_keys()
+        groups = self._group_import_rows(keys)
+        lookups = self._resolve_import_keys(keys)
+        if self.bulk_create:
+            return self._import_groups_bulk(groups, lookups)
+        for ref, group in groups:
+            lines=[]
+            for val in group:
+                res = self._prepare_import_line(val, lookups)
+                move, move_vals = self._get_import_move(val, lookups)
+                if not move:
+                    move = move.create(move_vals)
+                    date, ref, journal = self._get_import_move_key(val)
+                    lookups['move'][(date, ref, move_vals['journal_id'])] = move.id
+                lines.append((0,0,res))
+            move.write({'line_ids' : lines})
@@ -0,0 +1,327 @@
+# -*- coding: utf-8 -*-
+# Part of BrowseInfo. See LICENSE file for full copyright and licensing details.
+
+"""Streaming readers for the journal entry import wizard.
+
+The helpers of this module never hold more than one decoded copy of the
+uploaded file: CSV uploads are base64-decoded chunk by chunk while the rows are
+parsed, spreadsheets are read from a ``BytesIO`` (XLSX through openpyxl in
+read-only mode). The rows are then grouped by ``ref`` in memory or, above
+``MAX_ROWS_IN_MEMORY`` rows, through an external merge sort which writes the
+parsed rows to temporary files, removed once merged.
+"""
+
+import binascii
+import csv
+import datetime
+import heapq
+import io
+import itertools
+import json
+import logging
+import tempfile
+import time
+
+_logger = logging.getLogger(__name__)
+
+try:
+    from openpyxl import load_workbook
+except ImportError:
+    _logger.debug('Cannot `import openpyxl`.')
+    load_workbook = None
+try:
+    import xlrd
+except ImportError:
+    _logger.debug('Cannot `import xlrd`.')
+    xlrd = None
+try:
+    from odf.namespaces import TABLENS
+    from odf.table import TableRow
+    from odf.teletype import extractText
+    from odf.text import P
+    from odoo.addons.base_import.models.odf_ods_reader import ODSReader
+except ImportError:
+    # the reader of base_import needs odfpy
+    _logger.debug('Cannot `import odf`.')
+    ODSReader = None
+
+IMPORT_KEYS = ['date', 'ref', 'journal', 'name', 'partner', 'analytic_account_id', 'account_code',
+               'date_maturity', 'debit', 'credit', 'amount_currency', 'currency']
+
+# number of rows above which rows are grouped with an external sort
+MAX_ROWS_IN_MEMORY = 50000
+
+# base64 characters decoded per read, must be a multiple of 4
+B64_CHUNK_SIZE = 4 * 16384
+
+EXCEL_EPOCH = datetime.datetime(1899, 12, 30)
+
+
+class ImportFileError(ValueError):
+    """The upload cannot be opened with the reader of its type."""
+
+
+class Base64Stream(io.RawIOBase):
+    """Read-only binary stream decoding a base64 payload on demand."""
+
+    def __init__(self, payload, chunk_size=B64_CHUNK_SIZE, stats=None):
+        super().__init__()
+        self._stats = stats
+        if isinstance(payload, str):
+            payload = payload.encode('ascii')
+        self._payload = memoryview(payload)
+        self._pos = 0
+        self._chunk_size = chunk_size
+        self._pending = b''
+        # characters of an incomplete quantum, when the payload has line breaks
+        self._carry = b''
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self._pending and self._pos < len(self._payload):
+            chunk = bytes(self._payload[self._pos:self._pos + self._chunk_size])
+            self._pos += self._chunk_size
+            start = time.time()
+            if self._carry or len(chunk) % 4 or b'\n' in chunk:
+                chunk = self._carry + chunk.translate(None, b' \t\r\n')
+                if self._pos < len(self._payload):
+                    size = len(chunk) - len(chunk) % 4
+                    chunk, self._carry = chunk[:size], chunk[size:]
+                else:
+                    self._carry = b''
+            self._pending = binascii.a2b_base64(chunk)
+            if self._stats is not None:
+                self._stats['decode'] = self._stats.get('decode', 0.0) + time.time() - start
+        size = min(len(buffer), len(self._pending))
+        buffer[:size] = self._pending[:size]
+        self._pending = self._pending[size:]
+        return size
+
+
+def iter_csv_rows(payload, keys=IMPORT_KEYS, encoding='utf-8', delimiter=',', stats=None):
+    """Yield the data rows of a base64 encoded CSV file as dicts.
+
+    The header row and blank lines are skipped. When ``stats`` is given, the
+    time spent decoding base64 is added to its ``decode`` key.
+    """
+    text = io.TextIOWrapper(io.BufferedReader(Base64Stream(payload, stats=stats)), encoding=encoding, newline='')
+    reader = csv.reader(text, delimiter=delimiter)
+    next(reader, None)
+    for field in reader:
+        values = dict(zip(keys, map(str, field)))
+        if values:
+            yield values
+
+
+def excel_date_to_string(value, epoch=EXCEL_EPOCH, cache=None):
+    """Convert an Excel cell value holding a date to ``YYYY-MM-DD``.
+
+    Serial numbers are counted in days from ``epoch``; a ``cache`` dict can be
+    given to convert each distinct serial only once for a whole sheet.
+    """
+    if isinstance(value, datetime.datetime):
+        return value.strftime('%Y-%m-%d')
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        serial = int(value)
+        if cache is None:
+            return (epoch + datetime.timedelta(days=serial)).strftime('%Y-%m-%d')
+        if serial not in cache:
+            cache[serial] = (epoch + datetime.timedelta(days=serial)).strftime('%Y-%m-%d')
+        return cache[serial]
+    return cell_to_string(value)
+
+
+def cell_to_string(value):
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return excel_date_to_string(value)
+    return str(value)
+
+
+def _decode(payload, stats=None):
+    start = time.time()
+    content = binascii.a2b_base64(payload)
+    if stats is not None:
+        stats['decode'] = stats.get('decode', 0.0) + time.time() - start
+    return content
+
+
+def _iter_sheet_rows(lines, keys, date_keys, epoch=EXCEL_EPOCH):
+    """Convert the data rows of a sheet (header first) into row dicts."""
+    date_cache = {}
+    next(lines, None)
+    for line in lines:
+        if all(cell is None or cell == '' for cell in line):
+            continue
+        values = {}
+        for key, cell in zip(keys, line):
+            if key in date_keys:
+                values[key] = excel_date_to_string(cell, epoch, date_cache)
+            else:
+                values[key] = cell_to_string(cell)
+        for key in keys[len(values):]:
+            values[key] = ''
+        yield values
+
+
+def iter_xlsx_rows(payload, keys=IMPORT_KEYS, date_keys=('date', 'date_maturity'), stats=None):
+    """Yield the data rows of the first sheet of a base64 encoded XLSX file."""
+    if load_workbook is None:
+        raise ImportError('openpyxl is required to read XLSX files')
+    try:
+        workbook = load_workbook(io.BytesIO(_decode(payload, stats)), read_only=True, data_only=True)
+    except Exception as e:
+        raise ImportFileError(e)
+    try:
+        sheet = workbook.worksheets[0]
+        epoch = getattr(workbook, 'epoch', EXCEL_EPOCH)
+        yield from _iter_sheet_rows(sheet.iter_rows(values_only=True), keys, date_keys, epoch)
+    finally:
+        workbook.close()
+
+
+def iter_xls_rows(payload, keys=IMPORT_KEYS, date_keys=('date', 'date_maturity'), stats=None):
+    """Yield the data rows of the first sheet of a base64 encoded XLS file."""
+    if xlrd is None:
+        raise ImportError('xlrd is required to read XLS files')
+    try:
+        workbook = xlrd.open_workbook(file_contents=_decode(payload, stats), on_demand=True)
+        sheet = workbook.sheet_by_index(0)
+    except Exception as e:
+        raise ImportFileError(e)
+    epoch = workbook.datemode and datetime.datetime(1904, 1, 1) or EXCEL_EPOCH
+    try:
+        lines = (sheet.row_values(row_no) for row_no in range(sheet.nrows))
+        yield from _iter_sheet_rows(lines, keys, date_keys, epoch)
+    finally:
+        workbook.release_resources()
+
+
+def ods_cell_value(cell):
+    """Return the value of an ODS cell rather than its displayed text.
+
+    Numbers are read from ``office:value`` and dates from
+    ``office:date-value``, whatever their display format in the sheet.
+    """
+    value_type = cell.getAttribute('valuetype')
+    if value_type in ('float', 'percentage', 'currency'):
+        return float(cell.getAttribute('value'))
+    if value_type == 'date':
+        # the time part of a datetime is dropped
+        return cell.getAttribute('datevalue')[:10]
+    if value_type == 'boolean':
+        return cell.getAttribute('booleanvalue')
+    return '\n'.join(extractText(p) for p in cell.getElementsByType(P))
+
+
+if ODSReader is not None:
+    class ODSValueReader(ODSReader):
+        """ODSReader of base_import keeping the values of the cells."""
+
+        max_columns = 64
+
+        def readSheet(self, sheet):
+            rows = []
+            for row in sheet.getElementsByType(TableRow):
+                cells = []
+                spanned_value, spanned = '', 0
+                for cell in row.childNodes:
+                    qname = getattr(cell, 'qname', None)
+                    if qname == (TABLENS, 'table-cell'):
+                        value = ods_cell_value(cell)
+                        if self.clonespannedcolumns:
+                            spanned_value = value
+                            spanned = int(cell.getAttribute('numbercolumnsspanned') or 1) - 1
+                    elif qname == (TABLENS, 'covered-table-cell'):
+                        value = spanned and spanned_value or ''
+                        spanned = max(spanned - 1, 0)
+                    else:
+                        continue
+                    # trailing empty cells are often repeated up to the last column
+                    repeat = min(int(cell.getAttribute('numbercolumnsrepeated') or 1), self.max_columns)
+                    cells.extend([value] * repeat)
+                    if len(cells) >= self.max_columns:
+                        break
+                if any(cell != '' for cell in cells):
+                    rows.extend([cells] * int(row.getAttribute('numberrowsrepeated') or 1))
+            self.SHEETS[sheet.getAttribute('name')] = rows
+
+
+def iter_ods_rows(payload, keys=IMPORT_KEYS, date_keys=('date', 'date_maturity'), stats=None):
+    """Yield the data rows of the first sheet of a base64 encoded ODS file."""
+    if ODSReader is None:
+        raise ImportError('odfpy is required to read ODS files')
+    try:
+        sheet = ODSValueReader(file=io.BytesIO(_decode(payload, stats)), clonespannedcolumns=True).getFirstSheet()
+    except Exception as e:
+        raise ImportFileError(e)
+    yield from _iter_sheet_rows(iter(sheet), keys, date_keys)
+
+
+def is_xlsx(payload):
+    """Return whether a base64 encoded payload is a zip based (XLSX) file."""
+    head = payload[:8]
+    if isinstance(head, str):
+        head = head.encode('ascii')
+    return binascii.a2b_base64(head).startswith(b'PK')
+
+
+def group_rows_by_ref(rows, max_rows_in_memory=MAX_ROWS_IN_MEMORY, key='ref'):
+    """Group ``rows`` by ``key``, sorted by key and in file order within a group.
+
+    ``rows`` is consumed before this function returns, the groups are then
+    yielded lazily as ``(ref, [rows])``. When there are more than
+    ``max_rows_in_memory`` rows, sorted runs are spilled to temporary files and
+    merged, so that only one run or one group is held in memory at a time.
+    """
+    runs = []
+    buffer = []
+    for seq, row in enumerate(rows):
+        buffer.append((row[key], seq, row))
+        if len(buffer) >= max_rows_in_memory:
+            runs.append(_spill_run(buffer))
+            buffer = []
+    if not runs:
+        buffer.sort(key=lambda item: (item[0], item[1]))
+        return _iter_groups(buffer)
+    if buffer:
+        runs.append(_spill_run(buffer))
+    _logger.info('Grouping imported rows through %s sorted runs', len(runs))
+    return _iter_merged_groups(runs)
+
+
+def _spill_run(buffer):
+    buffer.sort(key=lambda item: (item[0], item[1]))
+    run = tempfile.TemporaryFile(mode='w+', encoding='utf-8')
+    for item in buffer:
+        run.write(json.dumps(item))
+        run.write('\n')
+    run.seek(0)
+    return run
+
+
+def _iter_run(run):
+    with run:
+        for line in run:
+            yield tuple(json.loads(line))
+
+
+def _iter_groups(items):
+    for ref, group in itertools.groupby(items, key=lambda item: item[0]):
+        yield ref, [item[2] for item in group]
+
+
+def _iter_merged_groups(runs):
+    try:
+        merged = heapq.merge(*[_iter_run(run) for run in runs], key=lambda item: (item[0], item[1]))
+        yield from _iter_groups(merged)
+    finally:
+        for run in runs:
+            run.close()
@@ -47,8 +47,11 @@ Key Features:
         'security/ir.model.access.csv',
         'security/purchase_security.xml',
         'data/purchase_approval_route.xml',
+        'data/purchase_order_actions.xml',
+        'data/ir_cron.xml',
         'views/purchase_approval_route.xml',
         'views/res_config_settings_views.xml',
+        'views/purchase_approval_notification_views.xml',
     ],
     'depends': ['purchase'],
     'qweb': [],
@@ -1,22 +1,88 @@
 # coding: utf-8
+import logging
+import time
 
 from odoo import api, SUPERUSER_ID
 
+_logger = logging.getLogger(__name__)
+
+# purchase.order.approver ids updated per query
+CHUNK_SIZE = 50000
+
 
 def migrate(cr, version):
     env = api.Environment(cr, SUPERUSER_ID, {})
+    # pending ORM updates must be in the database before updating it in SQL
+    env.flush_all()
+
+    cr.execute("""
+        SELECT MIN(id), MAX(id), COUNT(*)
+          FROM purchase_order_approver
+         WHERE team_approver_id IS NOT NULL
+    """)
+    min_id, max_id, total = cr.fetchone()
+    if not total:
+        return
+
+    start = time.time()
+    order_ids = set()
+    updated = 0
+    for chunk_start in range(min_id, max_id + 1, CHUNK_SIZE):
+        # copy the team approver values, only on rows that differ
+        cr.execute("""
+            UPDATE purchase_order_approver poa
+               SET sequence = pta.sequence,
+                   team_id = pta.team_id,
+                   user_id = pta.user_id,
+                   role = pta.role,
+                   min_amount = pta.min_amount,
+                   max_amount = pta.max_amount,
+                   lock_amount_total = pta.lock_amount_total,
+                   write_uid = %(uid)s,
+                   write_date = NOW() AT TIME ZONE 'UTC'
+              FROM purchase_team_approver pta
+             WHERE pta.id = poa.team_approver_id
+               AND poa.id >= %(start)s AND poa.id < %(stop)s
+               AND (poa.sequence, poa.team_id, poa.user_id, poa.role, poa.min_amount, poa.max_amount,
+                    poa.lock_amount_total)
+                   IS DISTINCT FROM
+                   (pta.sequence, pta.team_id, pta.user_id, pta.role, pta.min_amount, pta.max_amount,
+                    pta.lock_amount_total)
+         RETURNING poa.order_id
+        """, {'uid': SUPERUSER_ID, 'start': chunk_start, 'stop': chunk_start + CHUNK_SIZE})
+        rows = cr.fetchall()
+        updated += len(rows)
+        order_ids.update(order_id for order_id, in rows)
+        _logger.info('purchase.order.approver: %s/%s ids processed, %s rows updated (%.1fs)',
+                     min(chunk_start + CHUNK_SIZE, max_id + 1) - min_id, max_id + 1 - min_id,
+                     updated, time.time() - start)
+
+    # the ORM cache does not know about the updated rows
+    env.invalidate_all()
+
+    # the approvers of the orders depend on the copied sequence, user_id and
+    # lock_amount_total, which SQL updates do not mark as modified
+    Order = env['purchase.order']
+    fnames = ['current_approver', 'next_approver', 'lock_amount_total', 'pending_approver_user_id']
+    sorted_order_ids = sorted(order_ids)
+    for index in range(0, len(sorted_order_ids), CHUNK_SIZE):
+        orders = Order.browse(sorted_order_ids[index:index + CHUNK_SIZE])
+        for fname in fnames:
+            env.add_to_compute(Order._fields[fname], orders)
+        orders.flush_recordset(fnames)
+        env.invalidate_all()
 
-    order_approvers = env['purchase.order.approver'].search([])
-    for order_approver in order_approvers:
-        team_approver = order_approver.team_approver_id
-        if not team_approver:
-            continue
-        order_approver.write({
-            'sequence': team_approver.sequence,
-            'team_id': team_approver.team_id.id,
-            'user_id': team_approver.user_id.id,
-            'role': team_approver.role,
-            'min_amount': team_approver.min_amount,
-            'max_amount': team_approver.max_amount,
-            'lock_amount_total': team_approver.lock_amount_total,
-        })
+    # the orders waiting for approval are found by pending_approver_user_id
+    cr.execute("""
+        SELECT COUNT(*)
+          FROM purchase_order po
+     LEFT JOIN purchase_order_approver poa ON poa.id = po.current_approver
+         WHERE po.id = ANY(%s)
+           AND po.pending_approver_user_id IS DISTINCT FROM poa.user_id
+    """, [sorted_order_ids])
+    mismatches = cr.fetchone()[0]
+    if mismatches:
+        _logger.error('purchase.order: %s orders have a pending approver user different from their current '
+                      'approver after the migration', mismatches)
+    _logger.info('purchase.order.approver: %s rows of %s orders updated in %.1fs',
+                 updated, len(order_ids), time.time() - start)
@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 
 from . import purchase_order
+from . import purchase_approval_notification
 from . import purchase_team
 from . import res_config_settings
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+import logging
+import time
+
+from odoo import api, fields, models, _
+
+_logger = logging.getLogger(__name__)
+
+# notifications sent per transaction by the cron
+NOTIFICATION_BATCH_SIZE = 100
+
+# attempts to send a notification before the cron gives up on it
+NOTIFICATION_MAX_ATTEMPTS = 5
+
+
+class PurchaseApprovalNotification(models.Model):
+    _name = "purchase.approval.notification"
+    _description = "PO Approval Request Notification"
+    _order = 'id'
+
+    order_id = fields.Many2one(
+        comodel_name='purchase.order', string='Order',
+        required=True, ondelete='cascade')
+
+    partner_id = fields.Many2one(
+        comodel_name='res.partner', string='Recipient',
+        required=True, ondelete='cascade')
+
+    failure_reason = fields.Text(
+        string='Failure Reason', readonly=True,
+        help='Error raised by the last attempt to send the notification')
+
+    attempt_count = fields.Integer(
+        string='Failed Attempts', readonly=True,
+        help='Failed attempts to send the notification, which is no longer retried by the cron after '
+             'the maximum number of attempts')
+
+    def _send(self):
+        """
+        Send the request to approve mails, like send_to_approve does in immediate mode, each one in a
+        savepoint so that a failing notification does not prevent the others from being sent
+        :return: the notifications that could not be sent, marked with their failure reason
+        """
+        failed = self.browse()
+        for notification in self:
+            order = notification.order_id
+            try:
+                with self.env.cr.savepoint():
+                    order.with_user(order.user_id)._post_approval_message(
+                        'purchase_approval_route.request_to_approve', _('PO Approval: %s') % (order.name,),
+                        notification.partner_id)
+            except Exception as e:
+                _logger.exception('PO approval notification %s of %s could not be sent', notification.id, order.name)
+                notification.write({
+                    'failure_reason': str(e) or repr(e),
+                    'attempt_count': notification.attempt_count + 1,
+                })
+                failed |= notification
+        return failed
+
+    def action_retry(self):
+        """
+        Send the notifications again at the next run of the cron, failed ones included
+        """
+        self.write({'failure_reason': False, 'attempt_count': 0})
+        self.env.ref('purchase_approval_route.ir_cron_send_approval_notifications')._trigger()
+
+    @api.model
+    def _cron_send_notifications(self, time_limit=None):
+        """
+        Send the queued notifications by batches, committing after each batch
+        """
+        ICP = self.env['ir.config_parameter'].sudo()
+        batch_size = int(ICP.get_param('purchase_approval_route.notification_batch_size', NOTIFICATION_BATCH_SIZE))
+        if time_limit is None:
+            time_limit = int(ICP.get_param('purchase_approval_route.notification_time_limit', 240))
+        max_attempts = int(ICP.get_param('purchase_approval_route.notification_max_attempts', NOTIFICATION_MAX_ATTEMPTS))
+        start = time.time()
+        sent = 0
+        # the notifications failing in this run are retried by the next ones
+        failed = self.browse()
+        while time.time() - start < time_limit:
+            notifications = self.search(
+                [('attempt_count', '<', max_attempts), ('id', 'not in', failed.ids)], limit=batch_size)
+            if not notifications:
+                break
+            failed |= notifications._send()
+            notifications -= failed
+            sent += len(notifications)
+            notifications.unlink()
+            self.env.cr.commit()
+        else:
+            # time is up, continue in a next run
+            self.env.ref('purchase_approval_route.ir_cron_send_approval_notifications')._trigger()
+        if sent:
+            _logger.info('%s PO approval notifications sent in %.2fs', sent, time.time() - start)
@@ -1,23 +1,44 @@
 # -*- coding: utf-8 -*-
+import functools
+import logging
+import time
+from collections import defaultdict
+
 from odoo import api, fields, models, _
 from odoo.exceptions import UserError
-from odoo.tools.safe_eval import safe_eval
+
+# durations of the approval steps, enabled with --log-handler=odoo.addons.purchase_approval_route.timing:DEBUG
+_timing_logger = logging.getLogger('odoo.addons.purchase_approval_route.timing')
+
+# number of orders from which approvers are computed from the database in one pass
+APPROVER_BATCH_SIZE = 200
+
+
+def _timed(method):
+    """
+    Log the duration of the decorated method when the timing logger is enabled
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if not _timing_logger.isEnabledFor(logging.DEBUG):
+            return method(self, *args, **kwargs)
+        start = time.time()
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            _timing_logger.debug('operation=%s model=%s records=%s duration=%.6f',
+                                 method.__name__, self._name, len(self), time.time() - start)
+    return wrapper
 
 
 class PurchaseOrder(models.Model):
     _inherit = "purchase.order"
     
     def _get_team_domain(self, company=None):
-        members_domain = [
-            '|',
-            ('only_members', '=', False),
-            '&', ('only_members', '=', True), '|', ('team_member_ids', 'in', self.env.uid), ('user_id', '=', self.env.uid)
-        ]
         if not company:
             company = self.env.company
-        domain = [('company_id', '=', company.id)]
-        domain += members_domain
-        return domain
+        team_ids = self.env['purchase.team']._get_allowed_team_ids(company.id)
+        return [('id', 'in', list(team_ids))]
 
     po_order_approval_route = fields.Selection(related='company_id.po_order_approval_route',
                                                string="Use Approval Route", readonly=True)
@@ -39,12 +60,18 @@ class PurchaseOrder(models.Model):
         comodel_name="purchase.order.approver", string="Next Approver",
         compute="_compute_approver", store=True, compute_sudo=True)
 
+    pending_approver_user_id = fields.Many2one(
+        comodel_name="res.users", string="Waiting for Approval of",
+        related="current_approver.user_id", store=True, index="btree_not_null",
+        help="User of the current approver, stored to find the orders waiting for a user's approval")
+
     is_current_approver = fields.Boolean(
-        string="Is Current Approver", compute="_compute_is_current_approver"
+        string="Is Current Approver", compute="_compute_is_current_approver",
+        search="_search_is_current_approver"
     )
 
     lock_amount_total = fields.Boolean(
-        string="Lock Amount Total", compute="_compute_lock_amount_total"
+        string="Lock Amount Total", compute="_compute_approver", store=True, compute_sudo=True
     )
 
     amount_total = fields.Monetary(tracking=True)
@@ -65,6 +92,7 @@ class PurchaseOrder(models.Model):
             self._check_lock_amount_total()
         return super(PurchaseOrder, self)._track_subtype(init_values)
 
+    @_timed
     def button_approve(self, force=False):
         for order in self:
             if not order.team_id:
@@ -82,18 +110,12 @@ class PurchaseOrder(models.Model):
                     else:
                         # If there is not next approval, than assume that approval is finished and send notification
                         partner = order.user_id.partner_id if order.user_id else order.create_uid.partner_id
-                        order.message_post_with_view(
-                            'purchase_approval_route.order_approval',
-                            subject=_('PO Approved: %s') % (order.name,),
-                            composition_mode='mass_mail',
-                            partner_ids=[(4, partner.id)],
-                            auto_delete=True,
-                            auto_delete_message=True,
-                            parent_id=False,
-                            subtype_id=self.env.ref('mail.mt_note').id)
+                        order._post_approval_message(
+                            'purchase_approval_route.order_approval', _('PO Approved: %s') % (order.name,), partner)
                         # Do default behaviour to set state as "purchase" and update date_approve
                         return super(PurchaseOrder, order).button_approve(force)
 
+    @_timed
     def button_confirm(self):
         for order in self:
             if order.state not in ['draft', 'sent']:
@@ -119,53 +141,88 @@ class PurchaseOrder(models.Model):
                 order.message_subscribe([order.partner_id.id])
         return True
 
+    @_timed
     def generate_approval_route(self):
         """
         Generate approval route for order
         :return:
         """
-        for order in self:
-            if not order.team_id:
+        orders = self.filtered('team_id')
+        # reset approval route
+        orders.approver_ids.unlink()
+        # currency rates and converted thresholds are shared by the whole batch
+        rates = {}
+        thresholds = {}
+        vals_list = []
+        for order in orders:
+            for team_approver in order._get_route_team_approvers(order.team_id, rates, thresholds):
+                # Add approver to the PO
+                vals_list.append(order._prepare_approver_vals(team_approver))
+        return self.env['purchase.order.approver'].create(vals_list)
+
+    def _get_route_team_approvers(self, team, rates, thresholds):
+        """
+        Return the approvers of the team that the approval route of the order would contain
+        :param rates: dict caching conversion rates, see _get_approver_thresholds
+        :param thresholds: dict caching converted amounts, see _get_approver_thresholds
+        :return: list of purchase.team.approver
+        """
+        self.ensure_one()
+        team_approvers = []
+        for team_approver in team.approver_ids:
+
+            custom_condition = self.compute_custom_condition(team_approver)
+            if not custom_condition:
+                # Skip approver, if custom condition for the approver is set and the condition result is not True
                 continue
-            if order.approver_ids:
-                # reset approval route
-                order.approver_ids.unlink()
-            for team_approver in order.team_id.approver_ids:
-
-                custom_condition = order.compute_custom_condition(team_approver)
-                if not custom_condition:
-                    # Skip approver, if custom condition for the approver is set and the condition result is not True
-                    continue
-
-                min_amount = team_approver.company_currency_id._convert(
-                    team_approver.min_amount,
-                    order.currency_id,
-                    order.company_id,
-                    order.date_order or fields.Date.today())
-                if min_amount > order.amount_total:
-                    # Skip approver if Minimum Amount is greater than Total Amount
-                    continue
-                max_amount = team_approver.company_currency_id._convert(
-                    team_approver.max_amount,
-                    order.currency_id,
-                    order.company_id,
-                    order.date_order or fields.Date.today())
-                if max_amount and max_amount < order.amount_total:
-                    # Skip approver if Maximum Amount is set and less than Total Amount
-                    continue
 
-                # Add approver to the PO
-                self.env['purchase.order.approver'].create({
-                    'sequence': team_approver.sequence,
-                    'team_id': team_approver.team_id.id,
-                    'user_id': team_approver.user_id.id,
-                    'role': team_approver.role,
-                    'min_amount': team_approver.min_amount,
-                    'max_amount': team_approver.max_amount,
-                    'lock_amount_total': team_approver.lock_amount_total,
-                    'order_id': order.id,
-                    'team_approver_id': team_approver.id,
-                })
+            min_amount, max_amount = self._get_approver_thresholds(team_approver, rates, thresholds)
+            if min_amount > self.amount_total:
+                # Skip approver if Minimum Amount is greater than Total Amount
+                continue
+            if max_amount and max_amount < self.amount_total:
+                # Skip approver if Maximum Amount is set and less than Total Amount
+                continue
+
+            team_approvers.append(team_approver)
+        return team_approvers
+
+    def _prepare_approver_vals(self, team_approver):
+        self.ensure_one()
+        return {
+            'sequence': team_approver.sequence,
+            'team_id': team_approver.team_id.id,
+            'user_id': team_approver.user_id.id,
+            'role': team_approver.role,
+            'min_amount': team_approver.min_amount,
+            'max_amount': team_approver.max_amount,
+            'lock_amount_total': team_approver.lock_amount_total,
+            'order_id': self.id,
+            'team_approver_id': team_approver.id,
+        }
+
+    def _get_approver_thresholds(self, team_approver, rates, thresholds):
+        """
+        Return Minimum and Maximum Amount of the team approver in the order currency
+        :param rates: dict caching conversion rates by (from, to, company, date)
+        :param thresholds: dict caching converted amounts by (team approver, rate key)
+        :return: (min_amount, max_amount)
+        """
+        self.ensure_one()
+        from_currency = team_approver.company_currency_id
+        date = fields.Date.to_date(self.date_order or fields.Date.today())
+        rate_key = (from_currency.id, self.currency_id.id, self.company_id.id, date)
+        threshold_key = (team_approver.id,) + rate_key
+        if threshold_key not in thresholds:
+            if rate_key not in rates:
+                rates[rate_key] = self.env['res.currency']._get_conversion_rate(
+                    from_currency, self.currency_id, self.company_id, date)
+            rate = rates[rate_key]
+            thresholds[threshold_key] = (
+                self.currency_id.round(team_approver.min_amount * rate),
+                self.currency_id.round(team_approver.max_amount * rate),
+            )
+        return thresholds[threshold_key]
 
     def compute_custom_condition(self, team_approver):
         self.ensure_one()
@@ -173,32 +230,71 @@ class PurchaseOrder(models.Model):
         if not team_approver.custom_condition_code:
             return True
         try:
-            safe_eval(team_approver.custom_condition_code, localdict, mode='exec', nocopy=True)
-            return bool(localdict['result'])
+            return bool(team_approver._eval_custom_condition(localdict))
         except Exception as e:
             raise UserError(_('Wrong condition code defined for %s. Error: %s') % (team_approver.display_name, e))
 
-    @api.depends('approver_ids.state')
+    @api.depends('approver_ids.state', 'approver_ids.lock_amount_total')
     def _compute_approver(self):
+        if len(self) >= APPROVER_BATCH_SIZE and all(isinstance(order_id, int) for order_id in self.ids):
+            return self._compute_approver_batch()
         for order in self:
-            next_approvers = order.approver_ids.filtered(lambda a: a.state == "to approve")
-            order.next_approver = next_approvers[0] if next_approvers else False
+            # approvers are sorted by sequence, keep the first one of each state
+            next_approver = current_approver = False
+            lock_amount_total = False
+            for approver in order.approver_ids:
+                if approver.state == 'to approve':
+                    next_approver = next_approver or approver
+                elif approver.state == 'pending':
+                    current_approver = current_approver or approver
+                elif approver.state == 'approved' and approver.lock_amount_total:
+                    lock_amount_total = True
+            order.next_approver = next_approver
+            order.current_approver = current_approver
+            order.lock_amount_total = lock_amount_total
 
-            current_approvers = order.approver_ids.filtered(lambda a: a.state == "pending")
-            order.current_approver = current_approvers[0] if current_approvers else False
+    def _compute_approver_batch(self):
+        """
+        Compute current and next approvers and lock_amount_total of many orders with two queries
+        instead of reading the approvers of each order
+        """
+        Approver = self.env['purchase.order.approver']
+        Approver.flush_model(['order_id', 'state', 'sequence', 'lock_amount_total'])
+        next_approvers = {}
+        current_approvers = {}
+        approvers = Approver.search_fetch(
+            [('order_id', 'in', self.ids), ('state', 'in', ['to approve', 'pending'])],
+            ['order_id', 'state'], order='sequence, id')
+        for approver in approvers:
+            by_order = next_approvers if approver.state == 'to approve' else current_approvers
+            by_order.setdefault(approver.order_id.id, approver)
+        locked_orders = Approver._read_group(
+            [('order_id', 'in', self.ids), ('state', '=', 'approved'), ('lock_amount_total', '=', True)],
+            ['order_id'])
+        locked_order_ids = {order.id for order, in locked_orders}
+        for order in self:
+            order.next_approver = next_approvers.get(order.id, False)
+            order.current_approver = current_approvers.get(order.id, False)
+            order.lock_amount_total = order.id in locked_order_ids
 
-    @api.depends('current_approver')
+    @api.depends('pending_approver_user_id')
+    @api.depends_context('uid')
     def _compute_is_current_approver(self):
         for order in self:
-            order.is_current_approver = ((order.current_approver and order.current_approver.user_id == self.env.user)
-                                         or self.env.is_superuser())
+            order.is_current_approver = order.pending_approver_user_id == self.env.user or self.env.is_superuser()
 
-    @api.depends('approver_ids.state', 'approver_ids.lock_amount_total')
-    def _compute_lock_amount_total(self):
-        for order in self:
-            order.lock_amount_total = len(order.approver_ids.filtered(lambda a: a.state == "approved" and a.lock_amount_total)) > 0
+    def _search_is_current_approver(self, operator, value):
+        if operator not in ('=', '!=') or not isinstance(value, bool):
+            raise UserError(_('Operation not supported'))
+        if self.env.is_superuser():
+            return [(1, '=', 1)] if (operator == '=') == value else [(0, '=', 1)]
+        if (operator == '=') == value:
+            return [('pending_approver_user_id', '=', self.env.uid)]
+        return ['|', ('pending_approver_user_id', '=', False), ('pending_approver_user_id', '!=', self.env.uid)]
 
+    @_timed
     def send_to_approve(self):
+        deferred_vals_list = []
         for order in self:
             if order.state != 'to approve' and not order.team_id:
                 continue
@@ -217,15 +313,136 @@ class PurchaseOrder(models.Model):
             current_approver_partner = order.current_approver.user_id.partner_id
             if current_approver_partner not in order.message_partner_ids:
                 order.message_subscribe([current_approver_partner.id])
-            order.with_user(order.user_id).message_post_with_view(
-                'purchase_approval_route.request_to_approve',
-                subject=_('PO Approval: %s') % (order.name,),
-                composition_mode='mass_mail',
-                partner_ids=[(4, current_approver_partner.id)],
-                auto_delete=True,
-                auto_delete_message=True,
-                parent_id=False,
-                subtype_id=self.env.ref('mail.mt_note').id)
+            if order.company_id.po_approval_notification_mode == 'deferred':
+                # sent by the cron once the confirmation is committed
+                deferred_vals_list.append({'order_id': order.id, 'partner_id': current_approver_partner.id})
+                continue
+            order.with_user(order.user_id)._post_approval_message(
+                'purchase_approval_route.request_to_approve', _('PO Approval: %s') % (order.name,),
+                current_approver_partner)
+        if deferred_vals_list:
+            self.env['purchase.approval.notification'].sudo().create(deferred_vals_list)
+            self.env.ref('purchase_approval_route.ir_cron_send_approval_notifications')._trigger()
+
+    def _post_approval_message(self, template, subject, partner):
+        """
+        Post the approval mail of the order to a partner as a note
+        :param template: xml id of the QWeb template, rendered with `object`
+        """
+        self.ensure_one()
+        return self.message_post_with_source(
+            template,
+            render_values={'object': self},
+            subject=subject,
+            partner_ids=partner.ids,
+            subtype_xmlid='mail.mt_note')
+
+    def _subscribe_partners(self, partner_orders):
+        """
+        Subscribe partners to orders with one call per partner
+        :param partner_orders: dict {res.partner: purchase.order}
+        """
+        for partner, orders in partner_orders.items():
+            orders = orders.filtered(lambda o: partner not in o.message_partner_ids)
+            if orders:
+                orders.message_subscribe([partner.id])
+
+    def _send_approval_digest(self, template, subject, partner_orders):
+        """
+        Send one mail per partner listing all its orders, the template being rendered once per partner
+        :param template: xml id of the QWeb template, rendered with `partner` and `orders`
+        :param partner_orders: dict {res.partner: purchase.order}
+        """
+        vals_list = []
+        for partner, orders in partner_orders.items():
+            body = self.env['ir.qweb']._render(template, {'partner': partner, 'orders': orders})
+            vals_list.append({
+                'subject': subject % len(orders),
+                'body_html': body,
+                'email_from': self.env.user.email_formatted or self.env.company.email_formatted,
+                'recipient_ids': [(4, partner.id)],
+                'auto_delete': True,
+            })
+        # sent by the mail queue
+        return self.env['mail.mail'].sudo().create(vals_list)
+
+    @_timed
+    def _send_to_approve_digest(self):
+        """
+        Batch version of send_to_approve: one digest mail per approver instead of one mail per order
+        """
+        orders = self.filtered(lambda o: o.state == 'to approve' or o.team_id)
+        main_error_msg = _("Unable to send approval request to next approver.")
+        for order in orders:
+            if order.current_approver:
+                reason_msg = _("The order must be approved by %s") % order.current_approver.user_id.name
+                raise UserError("%s %s" % (main_error_msg, reason_msg))
+            if not order.next_approver:
+                reason_msg = _("There are no approvers in the selected PO team.")
+                raise UserError("%s %s" % (main_error_msg, reason_msg))
+        # use sudo as purchase user cannot update purchase.order.approver
+        orders.sudo().next_approver.write({'state': 'pending'})
+        partner_orders = defaultdict(lambda: self.browse())
+        for order in orders:
+            partner_orders[order.current_approver.user_id.partner_id] |= order
+        self._subscribe_partners(partner_orders)
+        self._send_approval_digest(
+            'purchase_approval_route.request_to_approve_digest', _('PO Approval: %s orders'), partner_orders)
+
+    @_timed
+    def action_mass_confirm(self):
+        """
+        Confirm orders in batch: approval routes are generated at once, requests to approve are sent
+        as one digest per approver and subscriptions are done per partner
+        """
+        orders = self.filtered(lambda o: o.state in ['draft', 'sent'])
+        without_team = orders.filtered(lambda o: not o.team_id)
+        if without_team:
+            # Do default behaviour if PO Team is not set
+            super(PurchaseOrder, without_team).button_confirm()
+        orders -= without_team
+        orders.generate_approval_route()
+        to_approve = orders.filtered('next_approver')
+        if to_approve:
+            to_approve.write({'state': 'to approve'})
+            to_approve._send_to_approve_digest()
+        if orders - to_approve:
+            # If there are not approvers, do default behaviour and move PO to the "Purchase Order" state
+            super(PurchaseOrder, orders - to_approve).button_approve()
+        orders._add_supplier_to_product()
+        partner_orders = defaultdict(lambda: self.browse())
+        for order in orders:
+            partner_orders[order.partner_id] |= order
+        self._subscribe_partners(partner_orders)
+        return True
+
+    @_timed
+    def action_mass_approve(self, force=False):
+        """
+        Approve orders in batch for the current approver, notifications being sent as digests
+        """
+        without_team = self.filtered(lambda o: not o.team_id)
+        if without_team:
+            # Do default behaviour if PO Team is not set
+            super(PurchaseOrder, without_team).button_approve(force)
+        orders = (self - without_team).filtered(
+            lambda o: o.current_approver and (o.current_approver.user_id == self.env.user or self.env.is_superuser()))
+        orders.current_approver.write({'state': 'approved'})
+        for order in orders:
+            order.message_post(body=_('PO approved by %s') % self.env.user.name)
+        with_next = orders.filtered('next_approver')
+        if with_next:
+            with_next._send_to_approve_digest()
+        approved = orders - with_next
+        if approved:
+            partner_orders = defaultdict(lambda: self.browse())
+            for order in approved:
+                partner = order.user_id.partner_id if order.user_id else order.create_uid.partner_id
+                partner_orders[partner] |= order
+            self._send_approval_digest(
+                'purchase_approval_route.order_approval_digest', _('PO Approved: %s orders'), partner_orders)
+            super(PurchaseOrder, approved).button_approve(force)
+        return True
 
     def _check_lock_amount_total(self):
         msg = _('Sorry, you are not allowed to change Amount Total of PO. ')
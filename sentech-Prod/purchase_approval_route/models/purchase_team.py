@@ -1,6 +1,23 @@
 # -*- coding: utf-8 -*-
-from odoo import api, fields, models, _
+import logging
+import time
+from collections import defaultdict
+
+from odoo import api, fields, models, tools, _
 from odoo.exceptions import UserError
+from odoo.tools.safe_eval import safe_eval
+
+_logger = logging.getLogger(__name__)
+
+# evaluations of custom conditions per team approver id in this process:
+# [count, total time, max time] in seconds
+CONDITION_STATS = defaultdict(lambda: [0, 0.0, 0.0])
+
+# custom conditions slower than this (in seconds) are logged
+SLOW_CONDITION_TIME = 0.1
+
+# orders held in the cache at once by the approval route simulation
+SIMULATION_BATCH_SIZE = 5000
 
 
 class PurchaseTeam(models.Model):
@@ -36,6 +53,108 @@ class PurchaseTeam(models.Model):
     
     
 
+    # fields of the teams on which the allowed teams of users depend
+    _allowed_team_fields = ('active', 'company_id', 'only_members', 'user_id', 'team_member_ids')
+
+    def init(self):
+        # version of the allowed teams, shared by the server workers
+        self.env.cr.execute("CREATE SEQUENCE IF NOT EXISTS purchase_team_allowed_version")
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        teams = super().create(vals_list)
+        teams._clear_allowed_team_ids_cache()
+        return teams
+
+    def write(self, vals):
+        fnames = [fname for fname in self._allowed_team_fields if fname in vals]
+        old_values = fnames and self._get_allowed_team_values(fnames)
+        res = super().write(vals)
+        if fnames and self._get_allowed_team_values(fnames) != old_values:
+            self._clear_allowed_team_ids_cache()
+        return res
+
+    def unlink(self):
+        res = super().unlink()
+        self._clear_allowed_team_ids_cache()
+        return res
+
+    def _get_allowed_team_values(self, fnames):
+        return {
+            team.id: [set(team[fname].ids) if team._fields[fname].type == 'one2many' else team[fname]
+                      for fname in fnames]
+            for team in self.with_context(active_test=False)
+        }
+
+    def _clear_allowed_team_ids_cache(self):
+        """
+        Drop the allowed teams of all users, in every server worker, by bumping the version in the key of
+        their cache: now for the current transaction and again once it is committed, so that other workers
+        do not keep teams computed before the commit
+        """
+        self.env.cr.execute("SELECT nextval('purchase_team_allowed_version')")
+        postcommit = self.env.cr.postcommit
+        if not postcommit.data.get('purchase_approval_route.allowed_team_ids'):
+            postcommit.data['purchase_approval_route.allowed_team_ids'] = True
+            registry = self.env.registry
+
+            @postcommit.add
+            def bump_allowed_teams_version():
+                with registry.cursor() as cr:
+                    cr.execute("SELECT nextval('purchase_team_allowed_version')")
+
+    @api.model
+    def _get_allowed_team_ids(self, company_id):
+        """
+        Teams the current user can select on orders of the company: teams open to everybody,
+        teams of which the user is a member and teams led by the user
+        :return: tuple of team ids
+        """
+        self.env.cr.execute("SELECT last_value FROM purchase_team_allowed_version")
+        return self._get_allowed_team_ids_cached(company_id, self.env.cr.fetchone()[0])
+
+    @api.model
+    @tools.ormcache('self.env.uid', 'company_id', 'version')
+    def _get_allowed_team_ids_cached(self, company_id, version):
+        members_domain = [
+            '|',
+            ('only_members', '=', False),
+            '&', ('only_members', '=', True), '|', ('team_member_ids', 'in', self.env.uid), ('user_id', '=', self.env.uid)
+        ]
+        domain = [('company_id', '=', company_id)]
+        domain += members_domain
+        return tuple(self.with_context(active_test=True).search(domain).ids)
+
+    def simulate_approval_route(self, orders):
+        """
+        Return the approval route the orders would get with the current approvers of the teams,
+        without creating any purchase.order.approver
+        :param orders: purchase.order recordset
+        :return: dict {order id: [purchase.team.approver ids, in approval order]}
+        If called on a team, the orders are simulated with this team, otherwise with their own team.
+        """
+        if len(self) > 1:
+            raise UserError(_('The approval route can be simulated with one team at a time.'))
+        start = time.time()
+        # currency rates and converted thresholds are shared by all the orders
+        rates = {}
+        thresholds = {}
+        routes = {}
+        order_ids = orders.ids
+        for index in range(0, len(order_ids), SIMULATION_BATCH_SIZE):
+            batch = orders.browse(order_ids[index:index + SIMULATION_BATCH_SIZE])
+            for order in batch:
+                team = self or order.team_id
+                if not team:
+                    routes[order.id] = []
+                    continue
+                team_approvers = order._get_route_team_approvers(team, rates, thresholds)
+                routes[order.id] = [team_approver.id for team_approver in team_approvers]
+            # keep the memory bounded, the teams are read again by the next batch
+            batch.invalidate_recordset()
+        _logger.info('Approval route simulated for %s orders in %.2fs', len(order_ids), time.time() - start)
+        return routes
+
     @api.constrains('company_id')
     def _check_company(self):
         for team in self:
@@ -88,6 +207,42 @@ class PurchaseTeamApprover(models.Model):
         help='You can enter python expression to define custom condition'
     )
 
+    condition_eval_count = fields.Integer(
+        string='Condition Evaluations', compute='_compute_condition_stats',
+        help='Number of evaluations of the custom condition in this server process')
+
+    condition_eval_avg_ms = fields.Float(
+        string='Condition Avg Time (ms)', compute='_compute_condition_stats', digits=(16, 3))
+
+    condition_eval_max_ms = fields.Float(
+        string='Condition Max Time (ms)', compute='_compute_condition_stats', digits=(16, 3))
+
+    def _compute_condition_stats(self):
+        for approver in self:
+            count, total, maximum = CONDITION_STATS.get(approver.id, (0, 0.0, 0.0))
+            approver.condition_eval_count = count
+            approver.condition_eval_avg_ms = count and 1000.0 * total / count or 0.0
+            approver.condition_eval_max_ms = 1000.0 * maximum
+
+    def _eval_custom_condition(self, localdict):
+        """
+        Evaluate the custom condition code with safe_eval(code, localdict, mode='exec', nocopy=True)
+        and record its evaluation time
+        :return: value of the 'result' variable set by the code
+        """
+        self.ensure_one()
+        start = time.time()
+        safe_eval(self.custom_condition_code, localdict, mode='exec', nocopy=True,
+                  filename='purchase.team.approver(%s).custom_condition_code' % self.id)
+        duration = time.time() - start
+        stats = CONDITION_STATS[self.id]
+        stats[0] += 1
+        stats[1] += duration
+        stats[2] = max(stats[2], duration)
+        if duration > SLOW_CONDITION_TIME:
+            _logger.warning('Slow custom condition on %s (id %s): %.3fs', self.display_name, self.id, duration)
+        return localdict['result']
+
     @api.onchange('user_id')
     def _detect_user_role(self):
         for approver in self:
@@ -125,6 +280,67 @@ class PurchaseOrderApprover(models.Model):
             ('approved', 'Approved'),
             ('rejected', 'Rejected'),
         ], string='Status', readonly=True, required=True, default='to approve')
+
+    pending_date = fields.Datetime(
+        string='Requested On', readonly=True, copy=False,
+        help='Date on which the approval was requested to the approver')
+
+    done_date = fields.Datetime(
+        string='Answered On', readonly=True, copy=False,
+        help='Date on which the approver approved or rejected the order')
+
+    def write(self, vals):
+        if vals.get('state') == 'pending':
+            vals = dict(vals, pending_date=fields.Datetime.now())
+        elif vals.get('state') in ('approved', 'rejected'):
+            vals = dict(vals, done_date=fields.Datetime.now())
+        return super().write(vals)
+
+    @api.model
+    def get_approval_metrics(self, groupby='team_id', date_from=None, date_to=None):
+        """
+        Aggregate the approval waiting times in SQL
+        :param groupby: 'team_id', 'user_id' or 'role'
+        :param date_from: only count answers given from this datetime (included)
+        :param date_to: only count answers given until this datetime (excluded)
+        :return: list of dicts with the group value, the number of answered approvals, the median and
+        95th percentile of their waiting time in hours and the number of approvals currently pending
+        """
+        if groupby not in ('team_id', 'user_id', 'role'):
+            raise UserError(_('Approval metrics cannot be grouped by %s') % groupby)
+        self.flush_model(['team_id', 'user_id', 'role', 'state', 'pending_date', 'done_date'])
+        conditions = []
+        params = {}
+        if date_from:
+            conditions.append('done_date >= %(date_from)s')
+            params['date_from'] = date_from
+        if date_to:
+            conditions.append('done_date < %(date_to)s')
+            params['date_to'] = date_to
+        done_condition = ' AND '.join(["state IN ('approved', 'rejected')", 'pending_date IS NOT NULL',
+                                       'done_date IS NOT NULL'] + conditions)
+        # groupby is checked above
+        self.env.cr.execute("""
+            SELECT {groupby},
+                   COUNT(*) FILTER (WHERE {done}) AS done_count,
+                   PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY EXTRACT(EPOCH FROM done_date - pending_date))
+                       FILTER (WHERE {done}) / 3600 AS median_wait,
+                   PERCENTILE_CONT(0.95) WITHIN GROUP (ORDER BY EXTRACT(EPOCH FROM done_date - pending_date))
+                       FILTER (WHERE {done}) / 3600 AS p95_wait,
+                   COUNT(*) FILTER (WHERE state = 'pending') AS queue_length
+              FROM purchase_order_approver
+             GROUP BY {groupby}
+            HAVING COUNT(*) FILTER (WHERE {done} OR state = 'pending') > 0
+             ORDER BY queue_length DESC, done_count DESC
+        """.format(groupby=groupby, done=done_condition), params)
+        metrics = self.env.cr.dictfetchall()
+        if groupby != 'role':
+            comodel = self._fields[groupby].comodel_name
+            names = dict((record.id, record.display_name) for record in
+                         self.env[comodel].browse([m[groupby] for m in metrics if m[groupby]]).exists())
+            for metric in metrics:
+                metric[groupby] = metric[groupby] and (metric[groupby], names.get(metric[groupby]))
+        return metrics
     
     
 class ResUserInherit(models.Model):
@@ -132,3 +348,17 @@ class ResUserInherit(models.Model):
     
     po_team_id = fields.Many2one(
         comodel_name='purchase.team', string='PO Team', ondelete='cascade')
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        users = super().create(vals_list)
+        if any(vals.get('po_team_id') for vals in vals_list):
+            self.env['purchase.team']._clear_allowed_team_ids_cache()
+        return users
+
+    def write(self, vals):
+        old_teams = 'po_team_id' in vals and {user.id: user.po_team_id for user in self}
+        res = super().write(vals)
+        if old_teams and any(user.po_team_id != old_teams[user.id] for user in self):
+            self.env['purchase.team']._clear_allowed_team_ids_cache()
+        return res
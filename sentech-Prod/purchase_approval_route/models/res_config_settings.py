@@ -1,6 +1,6 @@
 # -*- coding: utf-8 -*-
 
-from odoo import api, fields, models
+from odoo import fields, models
 
 
 class Company(models.Model):
@@ -13,9 +13,19 @@ class Company(models.Model):
             ('required', 'Required')
         ], string="Use Approval Route", default='no')
 
+    po_approval_notification_mode = fields.Selection(
+        selection=[
+            ('immediate', 'Immediate'),
+            ('deferred', 'Deferred')
+        ], string="Approval Request Sending", default='immediate',
+        help="Deferred: requests to approve are queued on confirmation and sent by a scheduled action")
+
 
 class ResConfigSettings(models.TransientModel):
     _inherit = 'res.config.settings'
 
     po_order_approval_route = fields.Selection(related='company_id.po_order_approval_route',
                                                string="Use Approval Route", readonly=False)
+
+    po_approval_notification_mode = fields.Selection(related='company_id.po_approval_notification_mode',
+                                                     string="Approval Request Sending", readonly=False)
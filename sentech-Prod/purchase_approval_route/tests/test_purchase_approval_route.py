@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+from unittest.mock import patch
+
+from odoo import fields
+from odoo.exceptions import UserError
+from odoo.modules.migration import load_script
+from odoo.tests import tagged
+from odoo.tests.common import TransactionCase, new_test_user
+
+from odoo.addons.purchase_approval_route.models.purchase_order import APPROVER_BATCH_SIZE, PurchaseOrder
+
+
+@tagged('post_install', '-at_install')
+class TestPurchaseApprovalRoute(TransactionCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.company = cls.env.company
+        cls.company.write({'po_order_approval_route': 'optional', 'po_approval_notification_mode': 'immediate'})
+        groups = 'base.group_user,purchase.group_purchase_user'
+        cls.user_1 = new_test_user(cls.env, login='par_approver_1', groups=groups, email='par1@example.com')
+        cls.user_2 = new_test_user(cls.env, login='par_approver_2', groups=groups, email='par2@example.com')
+        cls.user_3 = new_test_user(cls.env, login='par_approver_3', groups=groups, email='par3@example.com')
+        cls.team = cls.env['purchase.team'].create({
+            'name': 'PAR Team',
+            'company_id': cls.company.id,
+            'approver_ids': [
+                (0, 0, {'sequence': 10, 'user_id': cls.user_1.id, 'role': 'Buyer'}),
+                (0, 0, {'sequence': 20, 'user_id': cls.user_2.id, 'role': 'Manager', 'min_amount': 1000}),
+                (0, 0, {'sequence': 30, 'user_id': cls.user_3.id, 'role': 'Controller', 'max_amount': 1500,
+                        'custom_condition_code': 'result = PO.amount_total > 100'}),
+                (0, 0, {'sequence': 40, 'user_id': cls.user_1.id, 'role': 'Director', 'min_amount': 2000,
+                        'lock_amount_total': True}),
+            ],
+        })
+        # thresholds are converted into the order currency
+        cls.currency = cls.env['res.currency'].with_context(active_test=False).search(
+            [('id', '!=', cls.company.currency_id.id)], limit=1)
+        cls.currency.active = True
+        cls.env['res.currency.rate'].create({
+            'name': fields.Date.today(),
+            'rate': 2.0,
+            'currency_id': cls.currency.id,
+            'company_id': cls.company.id,
+        })
+        cls.vendor = cls.env['res.partner'].create({'name': 'PAR Vendor'})
+        cls.product = cls.env['product.product'].create({'name': 'PAR Product', 'type': 'consu'})
+        cls.orders = cls.env['purchase.order'].create([{
+            'partner_id': cls.vendor.id,
+            'team_id': cls.team.id,
+            'currency_id': index % 3 and cls.company.currency_id.id or cls.currency.id,
+            'order_line': [(0, 0, {
+                'product_id': cls.product.id,
+                'product_qty': 1,
+                'price_unit': index * 137 % 3000 + 50,
+            })],
+        } for index in range(APPROVER_BATCH_SIZE + 10)])
+
+    def _route(self, order):
+        return order.approver_ids.sorted(lambda approver: (approver.sequence, approver.id)).team_approver_id
+
+    def _reference_route(self, order):
+        """Approvers of the route as generated order by order before batching"""
+        team_approvers = self.env['purchase.team.approver']
+        date = order.date_order or fields.Date.today()
+        for team_approver in order.team_id.approver_ids:
+            if not order.compute_custom_condition(team_approver):
+                continue
+            currency = team_approver.company_currency_id
+            min_amount = currency._convert(team_approver.min_amount, order.currency_id, order.company_id, date)
+            if min_amount > order.amount_total:
+                continue
+            max_amount = currency._convert(team_approver.max_amount, order.currency_id, order.company_id, date)
+            if max_amount and max_amount < order.amount_total:
+                continue
+            team_approvers |= team_approver
+        return team_approvers
+
+    def test_generate_approval_route(self):
+        self.orders.generate_approval_route()
+        routes = set()
+        for order in self.orders:
+            route = self._route(order)
+            self.assertEqual(route, self._reference_route(order), order.amount_total)
+            routes.add(tuple(route.ids))
+            for approver in order.approver_ids:
+                team_approver = approver.team_approver_id
+                self.assertEqual(
+                    (approver.user_id, approver.sequence, approver.min_amount, approver.max_amount,
+                     approver.lock_amount_total),
+                    (team_approver.user_id, team_approver.sequence, team_approver.min_amount,
+                     team_approver.max_amount, team_approver.lock_amount_total))
+        # the amounts and currencies give different routes
+        self.assertGreater(len(routes), 3)
+        # generating again replaces the route
+        self.orders[:5].generate_approval_route()
+        self.assertEqual(self._route(self.orders[0]), self._reference_route(self.orders[0]))
+        self.assertEqual(len(self.orders[0].approver_ids), len(self._reference_route(self.orders[0])))
+
+    def test_compute_approver_batch(self):
+        orders = self.orders
+        orders.generate_approval_route()
+        for index, order in enumerate(orders):
+            approvers = order.approver_ids.sorted(lambda approver: (approver.sequence, approver.id))
+            if index % 4 == 1:
+                approvers[:1].state = 'pending'
+            elif index % 4 == 2:
+                approvers[:-1].state = 'approved'
+                approvers[-1:].state = 'pending'
+            elif index % 4 == 3:
+                approvers.state = 'approved'
+        self.env.flush_all()
+
+        def values():
+            return {order.id: (order.next_approver, order.current_approver, order.lock_amount_total)
+                    for order in orders}
+
+        field = self.env['purchase.order']._fields['next_approver']
+        with patch.object(PurchaseOrder, '_compute_approver_batch', autospec=True,
+                          side_effect=PurchaseOrder._compute_approver_batch) as compute_batch:
+            for order in orders:
+                self.env.add_to_compute(field, order)
+                order.next_approver
+            self.assertFalse(compute_batch.called)
+            per_record = values()
+            self.env.add_to_compute(field, orders)
+            orders[0].next_approver
+            self.assertEqual(compute_batch.call_count, 1)
+            self.assertEqual(values(), per_record)
+        # the cases of the test all happen
+        self.assertTrue(any(current for next_approver, current, lock in per_record.values()))
+        self.assertTrue(any(lock for next_approver, current, lock in per_record.values()))
+        self.assertTrue(any(not next_approver and not current for next_approver, current, lock in per_record.values()))
+
+    def _new_mails(self, subject, existing):
+        return self.env['mail.mail'].search([('id', 'not in', existing.ids), ('subject', '=like', subject + '%')])
+
+    def test_mass_confirm_approve(self):
+        orders = self.orders[:30]
+        existing = self.env['mail.mail'].search([])
+        orders.action_mass_confirm()
+        self.assertEqual(set(orders.mapped('state')), {'to approve'})
+        self.assertEqual(orders.current_approver.user_id, self.user_1)
+        # one digest listing all the orders of the approver
+        digests = self._new_mails('PO Approval:', existing)
+        self.assertEqual(len(digests), 1)
+        self.assertEqual(digests.recipient_ids, self.user_1.partner_id)
+        self.assertEqual(digests.subject, 'PO Approval: 30 orders')
+        self.assertIn(self.user_1.partner_id, orders[0].message_partner_ids)
+
+        existing = self.env['mail.mail'].search([])
+        with_next = orders.filtered(lambda order: len(order.approver_ids) > 1)
+        approved = orders - with_next
+        self.assertTrue(with_next and approved)
+        orders.with_user(self.user_1).action_mass_approve()
+        self.assertEqual(set(approved.mapped('state')), {'purchase'})
+        self.assertEqual(set(with_next.mapped('state')), {'to approve'})
+        next_users = with_next.current_approver.user_id
+        self.assertEqual(next_users, self.user_2 | self.user_3)
+        digests = self._new_mails('PO Approval:', existing)
+        self.assertEqual(digests.recipient_ids, next_users.partner_id)
+        self.assertEqual(len(digests), len(next_users))
+        for digest in digests:
+            count = len(with_next.filtered(lambda order: order.current_approver.user_id.partner_id == digest.recipient_ids))
+            self.assertEqual(digest.subject, 'PO Approval: %s orders' % count)
+        approval_digests = self._new_mails('PO Approved:', existing)
+        self.assertEqual(len(approval_digests), 1)
+        self.assertEqual(approval_digests.subject, 'PO Approved: %s orders' % len(approved))
+
+    def test_pending_approver_user(self):
+        orders = self.orders[:30]
+
+        def check():
+            self.env.flush_all()
+            for order in orders:
+                self.assertEqual(order.pending_approver_user_id, order.current_approver.user_id)
+            for user in self.user_1 | self.user_2 | self.user_3:
+                self.assertEqual(
+                    self.env['purchase.order'].search([('id', 'in', orders.ids), ('pending_approver_user_id', '=', user.id)]),
+                    orders.filtered(lambda order: order.current_approver.user_id == user))
+                self.assertEqual(
+                    orders.with_user(user).filtered_domain([('is_current_approver', '=', True)]),
+                    orders.filtered(lambda order: order.current_approver.user_id == user))
+
+        orders.action_mass_confirm()
+        check()
+        self.assertEqual(set(orders.mapped('pending_approver_user_id')), {self.user_1})
+        orders.with_user(self.user_1).action_mass_approve()
+        check()
+        orders.with_user(self.user_2).action_mass_approve()
+        check()
+        # a new route drops the pending approver
+        orders.filtered(lambda order: order.state == 'to approve').generate_approval_route()
+        check()
+        self.assertFalse(orders.filtered(lambda order: order.state == 'to approve').pending_approver_user_id)
+
+    def test_approval_messages(self):
+        order = self.orders.filtered(lambda order: len(self._reference_route(order)) == 1)[0]
+        order.button_confirm()
+        self.assertEqual(order.state, 'to approve')
+        self.assertIn('PO Approval: %s' % order.name, order.message_ids.mapped('subject'))
+        order.with_user(self.user_1).button_approve()
+        self.assertEqual(order.state, 'purchase')
+        self.assertIn('PO Approved: %s' % order.name, order.message_ids.mapped('subject'))
+
+    def test_deferred_notification_failure(self):
+        self.company.po_approval_notification_mode = 'deferred'
+        order = self.orders[0]
+        order.button_confirm()
+        notification = self.env['purchase.approval.notification'].search([('order_id', '=', order.id)])
+        self.assertEqual(notification.partner_id, self.user_1.partner_id)
+        with patch.object(PurchaseOrder, '_post_approval_message', autospec=True,
+                          side_effect=UserError('Mail server down')):
+            self.assertEqual(notification._send(), notification)
+            notification._send()
+        self.assertEqual(notification.attempt_count, 2)
+        self.assertEqual(notification.failure_reason, 'Mail server down')
+        notification.action_retry()
+        self.assertEqual(notification.attempt_count, 0)
+        self.assertFalse(notification._send())
+        self.assertIn('PO Approval: %s' % order.name, order.message_ids.mapped('subject'))
+
+    def test_migration_pending_approver(self):
+        orders = self.orders[:30]
+        orders.action_mass_confirm()
+        self.assertEqual(orders.pending_approver_user_id, self.user_1)
+        # the migration copies the team approver values into the order approvers in SQL
+        team_approver = self.team.approver_ids.filtered(lambda approver: approver.sequence == 10)
+        self.env.flush_all()
+        self.env.cr.execute('UPDATE purchase_team_approver SET user_id = %s WHERE id = %s',
+                            [self.user_2.id, team_approver.id])
+        migration = load_script('purchase_approval_route/migrations/14.0.1.2.03/post-migrate.py', 'post_migrate')
+        migration.migrate(self.env.cr, '14.0.1.2.02')
+        self.env.invalidate_all()
+        self.assertEqual(orders.current_approver.user_id, self.user_2)
+        self.assertEqual(orders.pending_approver_user_id, self.user_2)
+        self.assertEqual(
+            self.env['purchase.order'].search([('id', 'in', orders.ids), ('pending_approver_user_id', '=', self.user_2.id)]),
+            orders)